@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+from itertools import product
+from typing import List, Tuple, Dict, Set, Union, Optional, Callable, Any, Sequence
+
+from .Variables import IntVar, IntDomain, Trail
+from .VarsComparison import VarsComparison
+from .Constraints import Constraints
+from .Search import can_batch, batch_call
+from .Util import numpy
+
+Number = Union[int, float]
+# index of the constraint and the position of the variable revised in it
+Arc = Tuple[int, int]
+
+# Largest amount of value pairs evaluated at once by arc consistency.
+BATCH_MAX_CELLS = 2**20
+# Smallest amount of value pairs for which a constraint is revised with NumPy.
+BATCH_MIN_CELLS = 2**10
+# Constraints with more variables, or more combinations of values of the others, are revised by their bounds.
+GAC_MAX_ARITY = 4
+GAC_MAX_TUPLES = 2**12
+# Binary constraints with more value pairs are revised by their bounds too.
+GAC_MAX_PAIRS = 2**22
+
+
+class ArcConsistency:
+    """Generalized arc consistency over constraints of two or more variables, with an AC-3 worklist.
+    Each value keeps the last support found for it (AC-2001 residues). Constraints of up to GAC_MAX_ARITY variables
+    look for supports among the value combinations of the others, and larger ones shave the bounds of each domain with interval arithmetic.
+    Binary constraints are revised pair by pair up to GAC_MAX_PAIRS pairs of values, and past it by their bounds, which is weaker:
+    only the values past the lowest and highest ones with support are removed.
+    After a domain loses values, only the arcs of the other constraints of that variable are revised again."""
+    def __init__(self, constraints: Constraints, trail: Optional[Trail]=None) -> None:
+        self.trail = trail
+        self.constrs: List[VarsComparison] = list()
+        self.ends: List[List[IntVar]] = list()
+        self.functions: List[Callable] = list()
+        self.batch: List[bool] = list()
+        self.entailed: List[bool] = list()
+        # arcs revised again when the domain of the variable changes, the ones it supports
+        self.watches: Dict[IntVar, List[Arc]] = dict()
+        for constr in constraints:
+            constr_vars = list(constraints.get_vars(constr))
+            if len(constr_vars) < 2:
+                # left to node consistency
+                continue
+            self.constrs.append(constr)
+            self.entailed.append(False)
+            index = len(self.functions)
+            self.ends.append(constr_vars)
+            self.functions.append(constr.compile({var: i for i, var in enumerate(constr_vars)}))
+            self.batch.append(len(constr_vars) == 2 and can_batch([constr], [var.get_domain() for var in constr_vars]))
+            for i, var in enumerate(constr_vars):
+                self.watches.setdefault(var, list()).extend((index, side) for side in range(len(constr_vars)) if side != i)
+        # residues[index][side] maps a value of the revised variable to its last support
+        self.residues: List[List[Dict[Number, Any]]] = [[dict() for var in constr_vars] for constr_vars in self.ends]
+
+    def propagate(self) -> Set[IntVar]:
+        """Revises arcs until every value has a support in each constraint. Returns the variables whose domain changed."""
+        queue: List[Arc] = [(index, side) for index in range(len(self.functions)) for side in reversed(range(len(self.ends[index])))]
+        queued = set(queue)
+        changed: Set[IntVar] = set()
+        while len(queue) > 0:
+            arc = queue.pop()
+            queued.discard(arc)
+            for var in self.revise(arc):
+                if len(var.get_domain()) == 0:
+                    raise RuntimeError("Variable "+var.get_expr()+" has empty domain after arc consistency.")
+                changed.add(var)
+                for other in self.watches[var]:
+                    if other[0] != arc[0] and other not in queued:
+                        queued.add(other)
+                        queue.append(other)
+        return changed
+
+    def revise(self, arc: Arc) -> List[IntVar]:
+        """Removes the values of one end of the arc without support in the constraint. Returns the variables that lost values."""
+        index, side = arc
+        if self.entailed[index]:
+            return []
+        if self.constrs[index].entailment() is True:
+            # every combination left satisfies it, and without a trail the domains can only shrink
+            self.entailed[index] = self.trail is None
+            return []
+        if len(self.ends[index]) == 2:
+            var1, var2 = self.ends[index]
+            if len(var1.get_domain()) * len(var2.get_domain()) <= GAC_MAX_PAIRS:
+                return self.revise_pair(index, side)
+            return self.revise_bounds(index, side)
+        tuples = 1
+        for i, var in enumerate(self.ends[index]):
+            if i != side:
+                tuples *= len(var.get_domain())
+        if len(self.ends[index]) <= GAC_MAX_ARITY and tuples <= GAC_MAX_TUPLES:
+            return self.revise_supports(index, side)
+        return self.revise_bounds(index, side)
+
+    def revise_pair(self, index: int, side: int) -> List[IntVar]:
+        """Revises a binary constraint. Large domains are revised from both ends at once with NumPy."""
+        var, other = self.ends[index][side], self.ends[index][1 - side]
+        domain, other_domain = var.get_domain(), other.get_domain()
+        if self.batch[index] and len(domain) * len(other_domain) >= BATCH_MIN_CELLS:
+            var1, var2 = self.ends[index]
+            supports1, supports2 = batch_arc_supports(self.functions[index], var1.get_domain().as_array(), var2.get_domain().as_array())
+            if supports1 is not None:
+                revised = list()
+                for x, supports in ((var1, supports1), (var2, supports2)):
+                    if not supports.all():
+                        x.get_domain().retain(supports, self.trail)
+                        revised.append(x)
+                return revised
+
+        function = self.functions[index]
+        residues = self.residues[index][side]
+        # a support of a value is also a support of the value it pairs with in the reverse arc
+        reverse = self.residues[index][1 - side]
+        pair: List[Optional[Number]] = [None, None]
+        other_values: Optional[List[Number]] = None
+        removed: List[Number] = list()
+        for value in domain:
+            support = residues.get(value)
+            if support is not None and support in other_domain:
+                continue
+            if other_values is None:
+                other_values = list(other_domain)
+            pair[side] = value
+            for other_value in other_values:
+                pair[1 - side] = other_value
+                if function(pair):
+                    residues[value] = other_value
+                    reverse[other_value] = value
+                    break
+            else:
+                removed.append(value)
+        return self._remove(var, removed)
+
+    def revise_supports(self, index: int, side: int) -> List[IntVar]:
+        """Revises a constraint of few variables, looking for a combination of values of the others that satisfies it."""
+        constr_vars = self.ends[index]
+        var = constr_vars[side]
+        function = self.functions[index]
+        residues = self.residues[index]
+        others = [i for i in range(len(constr_vars)) if i != side]
+        domains = [x.get_domain() for x in constr_vars]
+        values: List[Optional[Number]] = [None] * len(constr_vars)
+        other_values: Optional[List[List[Number]]] = None
+        removed: List[Number] = list()
+        for value in domains[side]:
+            support = residues[side].get(value)
+            if support is not None and all(support[i] in domains[i] for i in others):
+                continue
+            if other_values is None:
+                other_values = [list(domains[i]) for i in others]
+            values[side] = value
+            for combination in product(*other_values):
+                for i, other_value in zip(others, combination):
+                    values[i] = other_value
+                if function(values):
+                    # the combination supports each of its values
+                    support = tuple(values)
+                    for i, other_value in enumerate(support):
+                        residues[i][other_value] = support
+                    break
+            else:
+                removed.append(value)
+        return self._remove(var, removed)
+
+    def revise_bounds(self, index: int, side: int) -> List[IntVar]:
+        """Revises a constraint of many variables, removing the lowest and highest values of the variable
+        while the interval bounds of the constraint show it can't hold with them."""
+        constr = self.constrs[index]
+        var = self.ends[index][side]
+        domain = var.get_domain()
+        if isinstance(domain, IntDomain):
+            candidates: Sequence[Number] = range(domain.min(), domain.max() + 1)
+        else:
+            candidates = list(domain)
+        first, last = candidates[0], candidates[-1]
+        # largest prefix and suffix of candidates that can't satisfy the constraint, found by bisection
+        low = _bisect(len(candidates), lambda i: constr.entailment({var: (first, candidates[i])}) is False)
+        if low == len(candidates):
+            return self._remove(var, list(domain))
+        high = _bisect(len(candidates), lambda i: constr.entailment({var: (candidates[-1 - i], last)}) is False)
+        lowest, highest = candidates[low], candidates[-1 - high]
+        return [var] if domain.restrict(lowest, highest, self.trail) > 0 else []
+
+    def _remove(self, var: IntVar, removed: List[Number]) -> List[IntVar]:
+        for value in removed:
+            var.remove_from_domain(value, self.trail)
+        return [var] if len(removed) > 0 else []
+
+
+def _bisect(size: int, failed: Callable[[int], bool]) -> int:
+    """Length of the prefix of `range(size)` for which `failed` holds, assuming it does on a prefix."""
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if failed(mid):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def batch_arc_supports(function: Callable, values1: Any, values2: Any) -> Tuple[Optional[Any], Optional[Any]]:
+    """Masks of the values of each variable with support in the other one, checking value pairs as an outer product.
+    Supports of the second variable are only looked for among the supported values of the first one."""
+    supports1 = numpy.zeros(len(values1), dtype=bool)
+    supports2 = numpy.zeros(len(values2), dtype=bool)
+    step = max(1, BATCH_MAX_CELLS // len(values2))
+    for start in range(0, len(values1), step):
+        chunk = values1[start:start+step]
+        block = batch_call(function, [chunk[:, None], values2[None, :]])
+        if block is None:
+            return None, None
+        block = numpy.broadcast_to(block, (len(chunk), len(values2)))
+        rows = block.any(axis=1)
+        supports1[start:start+step] = rows
+        supports2 |= block[rows].any(axis=0)
+    return supports1, supports2
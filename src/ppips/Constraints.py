@@ -2,19 +2,26 @@
 
 from __future__ import annotations
 
-from typing import overload, List, Dict, Union
+from typing import overload, List, Tuple, Dict, Union, Callable, Sequence, FrozenSet
 
 from .VarsOperations import AbstractVar
 from .VarsComparison import VarsComparison
 from .Optimize import Optimize, Maximize, Minimize
+from .Util import require_numpy, numpy
 
 Number = Union[int, float]
 Element = Union[AbstractVar, Number]
 ElementDict = Dict[Union[AbstractVar, str], Number]
+SlotsDict = Dict[AbstractVar, int]
+CompiledConstraint = Tuple[Callable[[Sequence[Number]], bool], List[int]]
 
 class Constraints:
     def __init__(self) -> None:
         self.constr: List[VarsComparison] = list()
+        # variables of each constraint, the constraints of each variable, and how many times each constraint was added
+        self.constr_vars: Dict[VarsComparison, FrozenSet[AbstractVar]] = dict()
+        self.var_constrs: Dict[AbstractVar, Dict[VarsComparison, None]] = dict()
+        self.copies: Dict[VarsComparison, int] = dict()
 
     def __str__(self):
         rest = f"<{self.__class__.__name__}:>"
@@ -25,18 +32,71 @@ class Constraints:
     def __iadd__(self, other: VarsComparison) -> Constraints:
         if isinstance(other, VarsComparison):
             self.constr.append(other)
+            self._index(other)
             return self
         return NotImplemented
     
     def __isub__(self, other: Union[List[VarsComparison], VarsComparison]) -> Constraints:
         if isinstance(other, VarsComparison):
             self.constr.remove(other)
+            self._unindex(other)
             return self
         elif isinstance(other, list):
+            removing: Dict[VarsComparison, int] = dict()
             for i in other:
-                self.constr.remove(i)
+                removing[i] = removing.get(i, 0) + 1
+                if removing[i] > self.copies.get(i, 0):
+                    raise ValueError("Constraint not in the set.")
+            kept = list()
+            for i in self.constr:
+                if removing.get(i, 0) > 0:
+                    removing[i] -= 1
+                    self._unindex(i)
+                else:
+                    kept.append(i)
+            self.constr = kept
             return self
         return NotImplemented
+
+    def _index(self, constr: VarsComparison) -> None:
+        copies = self.copies.get(constr, 0)
+        self.copies[constr] = copies + 1
+        if copies > 0:
+            return
+        constr_vars = frozenset(constr.get_vars())
+        self.constr_vars[constr] = constr_vars
+        for var in constr_vars:
+            self.var_constrs.setdefault(var, dict())[constr] = None
+
+    def _unindex(self, constr: VarsComparison) -> None:
+        copies = self.copies.pop(constr) - 1
+        if copies > 0:
+            self.copies[constr] = copies
+            return
+        for var in self.constr_vars.pop(constr):
+            constrs = self.var_constrs[var]
+            del constrs[constr]
+            if len(constrs) == 0:
+                del self.var_constrs[var]
+
+    def _reindex(self) -> None:
+        self.constr_vars.clear()
+        self.var_constrs.clear()
+        self.copies.clear()
+        for i in self.constr:
+            self._index(i)
+
+    def get_vars(self, constr: VarsComparison) -> FrozenSet[AbstractVar]:
+        """Variables of a constraint of this set, without walking its expression."""
+        return self.constr_vars[constr]
+
+    def get_constraints(self, var: AbstractVar) -> List[VarsComparison]:
+        """Constraints that contain the variable, in the order they were added."""
+        return list(self.var_constrs.get(var, ()))
+
+    def get_constrained_vars(self) -> FrozenSet[AbstractVar]:
+        """Variables that appear in some constraint."""
+        return frozenset(self.var_constrs)
     
     def evaluate(self, vars_dict: ElementDict) -> bool:
         for i in self.constr:
@@ -48,15 +108,51 @@ class Constraints:
     def __call__(self, vars_dict: ElementDict) -> bool:
         return self.evaluate(vars_dict)
 
+    def compile(self, slots: SlotsDict) -> List[CompiledConstraint]:
+        """Compiles every constraint whose variables all have a slot, along with the slots it reads.
+        The rest can't be decided by the slot array, so they are left out."""
+        compiled: List[CompiledConstraint] = list()
+        for i in self.constr:
+            constr_vars = self.constr_vars[i]
+            if all(var in slots for var in constr_vars):
+                compiled.append((i.compile(slots), sorted(slots[var] for var in constr_vars)))
+        return compiled
+
+    def evaluate_batch(self, values, vars: List[AbstractVar]):
+        """Boolean mask telling, for each row of `values`, if no constraint is false.
+        `values` is a 2-D array with one column per variable of `vars`; constraints over other variables are ignored."""
+        require_numpy()
+        values = numpy.asarray(values)
+        mask = numpy.ones(values.shape[0], dtype=bool)
+        for i in self.constr:
+            if self.constr_vars[i] <= set(vars):
+                mask &= i.evaluate_batch(values, vars)
+        return mask
+
     def update_constraints(self, vars_dict: ElementDict) -> None:
+        # only the constraints of the given variables can change
+        touched = set()
+        for var in vars_dict:
+            touched.update(self.var_constrs.get(var, ()))
         updated = list()
+        replaced = list()
         for i in self.constr:
+            if i not in touched:
+                updated.append(i)
+                continue
             constr = i(vars_dict)
             if isinstance(constr, VarsComparison):
                 updated.append(constr)
+                replaced.append((i, constr))
             elif not constr:
                 raise RuntimeError(f"Constraint false with provided value.\n\n\tConstraint: {i}\n\n\tvalues: {vars_dict}")
+            else:
+                replaced.append((i, None))
         self.constr = updated
+        for i, constr in replaced:
+            self._unindex(i)
+            if constr is not None:
+                self._index(constr)
 
     def __iter__(self):
         for i in self.constr:
@@ -64,15 +160,19 @@ class Constraints:
 
     def remove_repeated(self) -> None:
         """Remove constraints that are exactly the same."""
-        for i in range(len(self.constr)-1, -1, -1):
-            a = self.constr[i]
-            for j in range(i):
-                b = self.constr[j]
-                if a.is_equal(b):
-                    del self.constr[i]
-                    break
+        seen = set()
+        unique: List[VarsComparison] = list()
+        for i in self.constr:
+            key = i.get_key()
+            if key not in seen:
+                seen.add(key)
+                unique.append(i)
+        self.constr = unique
+        self._reindex()
     
     def redistribute(self) -> None:
         """Tries to redistribute each constraint, so the equals one looks like each other."""
         for i in self.constr:
             i.redistribute()
+        # redistributing can cancel out variables
+        self._reindex()
@@ -2,13 +2,19 @@
 
 from __future__ import annotations
 
-from typing import overload, List, Tuple, Dict, Set, Union, Optional
+import heapq
+from itertools import chain, product
+from typing import overload, List, Tuple, Dict, Set, Union, Optional, Callable, Any, Iterator, Iterable, Literal
 
-from .Variables import IntVar, IntVarContainer
-from .VarsOperations import ArithmeticElement, AbstractVar
+from .Variables import IntVar, Trail
+from .VarsOperations import ArithmeticElement, AbstractVar, LinearExpr, get_element_vars
 from .VarsComparison import VarsComparison
 from .Constraints import Constraints
 from .Optimize import Optimize, Maximize, Minimize
+from .Search import Search, Limits, can_batch, batch_call
+from .Consistency import ArcConsistency, batch_arc_supports
+from .Parallel import can_parallelize, solve_parallel, race, PORTFOLIO
+from .Util import numpy
 
 Number = Union[int, float]
 Element = Union[IntVar, Number]
@@ -24,6 +30,11 @@ class IntProblem:
         self.constraints = Constraints()
         self.objective: Optional[Optimize] = None
         self.removed_vars: ElementDict = dict()
+        # index of the configuration that answered the last solve_portfolio
+        self.portfolio_winner: Optional[int] = None
+        # outcome of the last solve: "optimal" if it finished, so in optimal mode its solutions are optimal, "feasible" if a limit
+        # stopped it after finding solutions, "infeasible" if it finished without any, "limit_reached" if a limit stopped it before
+        self.status: Optional[str] = None
 
     def get_expr(self) -> str:
         return self.name
@@ -71,83 +82,49 @@ class IntProblem:
 
     def get_constraints_for_var(self, var: IntVar, min_vars: int = 1, max_vars: int = 0) -> Set[VarsComparison]:
         constrs: Set[VarsComparison] = set()
-        for i in self.constraints:
-            constr_vars = i.get_vars()
-            if var in constr_vars:
-                if len(constr_vars)>=min_vars and (max_vars == 0 or len(constr_vars) <= max_vars):
-                    constrs.add(i)
+        for i in self.constraints.get_constraints(var):
+            constr_vars = self.constraints.get_vars(i)
+            if len(constr_vars)>=min_vars and (max_vars == 0 or len(constr_vars) <= max_vars):
+                constrs.add(i)
         return constrs
 
     def node_consistency(self) -> None:
-        removed_constr = list()
-        for i in self.constraints:
-            constr_vars = i.get_vars()
-            if len(constr_vars) == 1:
-                var = list(constr_vars)[0]
-                if node_consistency(var, i)[0]:
-                    var_value = list(var.get_domain())[0]
-                    if var in self.removed_vars:
-                        if self.removed_vars[var] != var_value:
-                            raise RuntimeError("Da fuck?")
-                    else:
-                        self.removed_vars[var] = var_value
-                        if var in self.vars: 
-                            self.vars.remove(var)
-                removed_constr.append(i)
-        self.constraints -= removed_constr
-        if len(removed_constr) > 0:
+        # fixing a variable can leave other constraints with one variable
+        while True:
+            removed_constr = list()
+            for i in self.constraints:
+                constr_vars = self.constraints.get_vars(i)
+                if len(constr_vars) == 1:
+                    var = list(constr_vars)[0]
+                    if node_consistency(var, i)[0]:
+                        var_value = var.get_domain().min()
+                        if var in self.removed_vars:
+                            if self.removed_vars[var] != var_value:
+                                raise RuntimeError("Da fuck?")
+                        else:
+                            self.removed_vars[var] = var_value
+                            if var in self.vars: 
+                                self.vars.remove(var)
+                    removed_constr.append(i)
+            if len(removed_constr) == 0:
+                break
+            self.constraints -= removed_constr
             self.constraints.update_constraints(self.removed_vars)
             if self.objective is not None:
                 self.objective.update(self.removed_vars)
     
     def arc_consistency(self) -> None:
         self.node_consistency()
-        for i in self.vars:
-            removed_constr = list()
-            constr_queue: List[VarsComparison] = list(self.get_constraints_for_var(i, 2, 2))
-            while len(constr_queue) > 0:
-                popped = constr_queue.pop()
-                popped_vars = list(popped.get_vars())
-                j = popped_vars[0]
-                k = popped_vars[1]
-                has_solution1, has_solution2, amount1, amount2 = arc_consistency(k, j, popped)
-
-                if has_solution1 and has_solution2:
-                    # remove constraint if both has_solution
-                    removed_constr.append(popped)
-
-                if has_solution1:
-                    # remove variable if has_solution1
-                    var_value = list(k.get_domain())[0]
-                    if k in self.removed_vars:
-                        if self.removed_vars[k] != var_value:
-                            raise RuntimeError("Da fuck?")
-                    else:
-                        self.removed_vars[k] = var_value
-                        if k in self.vars: 
-                            self.vars.remove(k)
-                elif amount1 > 0:
-                    constr_queue += list(self.get_constraints_for_var(k, 2, 2))
-
-                if has_solution2:
-                    # remove variable if has_solution2
-                    var_value = list(j.get_domain())[0]
-                    if j in self.removed_vars:
-                        if self.removed_vars[j] != var_value:
-                            raise RuntimeError("Da fuck?")
-                    else:
-                        self.removed_vars[j] = var_value
-                        if j in self.vars: 
-                            self.vars.remove(j)
-                elif amount2 > 0:
-                    constr_queue += list(self.get_constraints_for_var(j, 2, 2))
-
-            # remove constraints
-            self.constraints -= removed_constr
-            # update constraints
+        while True:
+            ArcConsistency(self.constraints).propagate()
+            # variables left with one value are replaced in the constraints, which may leave new unary ones
+            fixed = {x: x.get_domain().min() for x in self.vars if len(x.get_domain()) == 1}
+            if len(fixed) == 0:
+                break
+            self.removed_vars.update(fixed)
+            self.vars = [x for x in self.vars if x not in fixed]
             self.constraints.update_constraints(self.removed_vars)
             if self.objective is not None:
-                # update objective
                 self.objective.update(self.removed_vars)
             self.node_consistency()
 
@@ -159,135 +136,318 @@ class IntProblem:
 
     def generate_graph(self) -> VarsGraph:
         graph: VarsGraph = dict()
-        for i in self.constraints:
-            constr_vars = i.get_vars()
-            if len(constr_vars) >= 2:
-                for j in constr_vars:
+        for j in self.constraints.get_constrained_vars():
+            for i in self.constraints.get_constraints(j):
+                constr_vars = self.constraints.get_vars(i)
+                if len(constr_vars) >= 2:
                     if j not in graph:
                         graph[j] = set()
                     graph[j] |= constr_vars - {j}
         return graph
 
 
-    def _recursive_solver(self, vars_list: List[IntVarContainer], solutions: List[ElementDict], graph: VarsGraph, solutions_type: str, options: Dict[str, bool], actual: ElementDict=dict()):
-        assert(len(vars_list) > 0)
-
-        var: IntVarContainer = vars_list[0]
-        was_instanced: bool = var.instance_next()
-        if not was_instanced:
-            var.reset_instances()
-            if "gbj" in options and options["gbj"]:
-                return False, graph[var.get_var()]
-            return False, None
-
-        if not self.constraints({}):
-            return True, None
-
-        actual[var.get_var()] = var.get_instanced()
-        
-        if len(vars_list) == 1:
-            if solutions_type == "optimal":
-                assert self.objective is not None
-                actual_value = self.evaluate(actual)[1]
-                assert isinstance(actual_value, (int, float))
-                if self.objective.is_optimal(actual_value):
-                    solutions.append(actual)
-                elif self.objective.is_better_than_optimal(actual_value):
-                    solutions.clear()
-                    solutions.append(actual)
-            else:
-                solutions.append(actual)
-                if solutions_type == "first":
-                    return False, None
-            return True, None
-        
-        new_actual: ElementDict = dict(actual)
-        stay, g_jump = True, None
-        while stay:
-            new_actual = dict(new_actual)
-            stay, g_jump = self._recursive_solver(vars_list[1:], solutions, graph, solutions_type, options, new_actual)
-            if solutions_type == "first" and len(solutions) == 1:
-                return False, None
-            if "gbj" in options and options["gbj"] and g_jump is not None:
-                if var.get_var() not in g_jump:
-                    var.de_instance()
-                    return False, g_jump
-
-        new_actual = dict(new_actual)
-        return self._recursive_solver(vars_list, solutions, graph, solutions_type, options, new_actual)
-
-    def recursive_solver(self, vars_list: List[IntVarContainer], solutions: List[ElementDict], graph: VarsGraph, solutions_type: str, options: Dict[str, bool]):
-        stay, g_jump = True, None
-        while stay:
-            stay, g_jump = self._recursive_solver(vars_list, solutions, graph, solutions_type, options)
-
-
-    def solve(self, solutions_type: str="first", options: Dict[str, bool]=dict()) -> List[ElementDict]:
-        # first, optimal, all
-        if solutions_type not in ("first", "optimal", "all"):
+    @overload
+    def solve(self, solutions_type: Literal["count"], options: Dict[str, Any]=dict()) -> int: ...
+    @overload
+    def solve(self, solutions_type: str="first", options: Dict[str, Any]=dict()) -> List[ElementDict]: ...
+
+    def solve(self, solutions_type: str="first", options: Dict[str, Any]=dict()) -> Union[List[ElementDict], int]:
+        # first, optimal, all, count
+        if solutions_type not in ("first", "optimal", "all", "count"):
             raise ValueError("Invalid parameter for solve.")
         if solutions_type == "optimal" and self.objective is None:
             raise RuntimeError("Can't solve for optimal without objective.")
+        callback = options.get("on_improvement")
+        if callback is not None and not callable(callback):
+            raise ValueError(f"Invalid improvement callback {callback!r}.")
+        if solutions_type == "count":
+            return self.count_solutions(options)
+        limits = Limits(options)
+        if self.objective is not None:
+            self.objective.reset_optimal()
         solutions: List[ElementDict] = list()
-        vars_list = [IntVarContainer(x) for x in self.vars]
-        graph = self.generate_graph()
-
-        self.recursive_solver(vars_list, solutions, graph, solutions_type, options)
-
-        for x in self.vars:
-            x.de_instance()
+        if len(self.vars) == 0:
+            if self.constraints({}):
+                # every variable was already fixed by the consistency methods
+                solutions.append(dict())
+        else:
+            graph = self.generate_graph()
+            if callback is not None or limits.is_active():
+                # the callback gets values of the whole objective, and a limit reached in one component
+                # would leave the rest without solutions, dropping the ones already found
+                options = {**options, "decompose": False}
+            components, objectives = self._decompose(solutions_type == "optimal", options)
+            # solutions of each component, combined by product since they share no constraint
+            parts: List[List[ElementDict]] = list()
+            for vars, objective in zip(components, objectives):
+                if solutions_type == "optimal" and objective is None:
+                    # every solution of the component is part of an optimal one
+                    part = self._solve_component(vars, "all", options, graph, limits=limits)
+                else:
+                    part = self._solve_component(vars, solutions_type, options, graph, objective, limits)
+                if len(part) == 0:
+                    parts = list()
+                    break
+                parts.append(part)
+            if len(parts) > 0:
+                for combination in product(*parts):
+                    solution: ElementDict = dict()
+                    for part in combination:
+                        solution.update(part)
+                    solutions.append(solution)
+            if solutions_type == "optimal" and len(solutions) > 0:
+                self.objective.last_optimal = self.objective({**solutions[0], **self.removed_vars})
 
         if solutions_type == "all":
             if self.objective is not None:
                 solutions.sort(key=lambda x: self.evaluate(x)[1], reverse=isinstance(self.objective, Maximize))
 
+        self._set_status(len(solutions) > 0, limits)
         solutions = [{**x, **self.removed_vars} for x in solutions]
         return solutions
 
+    def _set_status(self, found: bool, limits: Limits) -> None:
+        if limits.reached:
+            self.status = "feasible" if found else "limit_reached"
+        else:
+            self.status = "optimal" if found else "infeasible"
 
-def node_consistency(var: IntVar, constr: VarsComparison) -> Tuple[bool, int]:
+    def solve_portfolio(self, solutions_type: str="first", configs: Optional[List[Dict[str, Any]]]=None, options: Dict[str, Any]=dict()) -> Union[List[ElementDict], int]:
+        """Races one search per configuration, each in its own process, and returns the answer of the first one to finish.
+        Each configuration is a dict of options that overrides `options`, by default the ones of PORTFOLIO. In optimal mode the searches share the best value found."""
+        if solutions_type not in ("first", "optimal", "all", "count"):
+            raise ValueError("Invalid parameter for solve.")
+        if solutions_type == "optimal" and self.objective is None:
+            raise RuntimeError("Can't solve for optimal without objective.")
+        configs = list(PORTFOLIO) if configs is None else configs
+        if len(configs) == 0:
+            raise ValueError("The portfolio needs at least one configuration.")
+        # processes of the portfolio can't start pools of their own, nor call back into this one
+        options = {key: value for key, value in options.items() if key != "on_improvement"}
+        configs = [{**options, **config, "workers": 1} for config in configs]
+        self.portfolio_winner, answer, self.status = race(self, solutions_type, configs)
+        if solutions_type == "count":
+            return answer
+        solutions = [{**dict(zip(self.vars, values)), **self.removed_vars} for values in answer]
+        if solutions_type == "optimal" and len(solutions) > 0:
+            self.objective.last_optimal = self.objective(solutions[0])
+        return solutions
+
+    def _solve_component(self, vars: List[IntVar], solutions_type: str, options: Dict[str, Any], graph: VarsGraph, objective: Optional[Optimize]=None, limits: Optional[Limits]=None) -> List[ElementDict]:
+        """Solutions over some of the variables, with the constraints among them. `objective` is only used for optimal.
+        The "on_improvement" option is called with each better value of the objective and its solution."""
+        callback = options.get("on_improvement")
+        if can_parallelize(vars, options):
+            report = None
+            if callback is not None:
+                report = lambda value, values: callback(value, {**dict(zip(vars, values)), **self.removed_vars})
+            return [dict(zip(vars, values)) for values in solve_parallel(vars, self.constraints, graph, options, solutions_type, objective, limits, report)]
+        solutions: List[ElementDict] = list()
+        best = None
+        search = Search(vars, self.constraints, graph, options, objective if solutions_type == "optimal" else None, limits)
+        assignments = iter(search)
+        try:
+            for values in assignments:
+                if solutions_type == "optimal":
+                    value = search.compiled_objective(values)
+                    if objective.is_better_than_optimal(value):
+                        objective.publish()
+                        solutions.clear()
+                        if callback is not None:
+                            callback(value, {**dict(zip(vars, values)), **self.removed_vars})
+                    elif not objective.is_optimal(value):
+                        continue
+                    elif best != value:
+                        # the best value was found by another process sharing the objective
+                        solutions.clear()
+                    solutions.append(dict(zip(vars, values)))
+                    best = value
+                    continue
+                solutions.append(dict(zip(vars, values)))
+                if solutions_type == "first":
+                    break
+        finally:
+            assignments.close()
+        return solutions
+
+    def _decompose(self, optimal: bool, options: Dict[str, Any]) -> Tuple[List[List[IntVar]], List[Optional[Optimize]]]:
+        """Independent components of the problem, and for optimal, the part of the objective of each one.
+        Terms of the objective are kept whole, so the variables of each term end up in the same component."""
+        if optimal:
+            objective = self.objective.objective
+            if isinstance(objective, LinearExpr):
+                terms = list(objective.get_terms().items())
+            elif isinstance(objective, ArithmeticElement):
+                terms = [(objective, 1)]
+            else:
+                terms = list()
+            terms_vars = [get_element_vars(term) for term, coeff in terms]
+        else:
+            terms, terms_vars = list(), list()
+        if not options.get("decompose", True):
+            components = [list(self.vars)]
+        else:
+            components = self.get_components(terms_vars)
+        if not optimal:
+            return components, [None] * len(components)
+        if len(components) == 1:
+            return components, [self.objective]
+        objectives: List[Optional[Optimize]] = list()
+        for component in components:
+            members = set(component)
+            expr = 0
+            for (term, coeff), term_vars in zip(terms, terms_vars):
+                if any(x in members for x in term_vars):
+                    expr = expr + coeff * term
+            objectives.append(type(self.objective)(expr) if isinstance(expr, ArithmeticElement) else None)
+        return components, objectives
+
+    def get_components(self, coupled: Iterable[Set[AbstractVar]]=()) -> List[List[IntVar]]:
+        """Splits the variables into groups that share no constraint, nor any of the sets in `coupled`. Each group keeps the order of the variables."""
+        parent: Dict[IntVar, IntVar] = {x: x for x in self.vars}
+        def find(x: IntVar) -> IntVar:
+            while parent[x] is not x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        for group in chain((self.constraints.get_vars(i) for i in self.constraints), coupled):
+            roots = [find(x) for x in group if x in parent]
+            for root in roots[1:]:
+                parent[find(root)] = find(roots[0])
+        components: Dict[IntVar, List[IntVar]] = dict()
+        for x in self.vars:
+            components.setdefault(find(x), list()).append(x)
+        return list(components.values())
+
+    def count_solutions(self, options: Dict[str, Any]=dict()) -> int:
+        """Amount of solutions, without building them. It's the product of the counts of the independent components,
+        and variables that appear in no constraint multiply it by the size of their domain.
+        With limits, every variable is searched at once, and the amount is the one found before reaching them."""
+        limits = Limits(options)
+        for i in self.constraints:
+            # constraints without variables aren't part of any component
+            if len(self.constraints.get_vars(i)) == 0 and not i({}):
+                self._set_status(False, limits)
+                return 0
+        if len(self.vars) == 0:
+            self._set_status(True, limits)
+            return 1
+        graph = self.generate_graph()
+        if limits.is_active():
+            # partial amounts of several components can't be multiplied
+            if can_parallelize(self.vars, options):
+                total = solve_parallel(self.vars, self.constraints, graph, options, "count", limits=limits)
+            else:
+                total = Search(self.vars, self.constraints, graph, options, limits=limits).count()
+            self._set_status(total > 0, limits)
+            return total
+        constrained = self.constraints.get_constrained_vars()
+        if not options.get("decompose", True):
+            components = [[x for x in self.vars if x in constrained]] + [[x] for x in self.vars if x not in constrained]
+        else:
+            components = self.get_components()
+        total = 1
+        for vars in components:
+            if len(vars) == 1 and vars[0] not in constrained:
+                total *= len(vars[0].get_domain())
+            elif can_parallelize(vars, options):
+                total *= solve_parallel(vars, self.constraints, graph, options, "count")
+            elif len(vars) > 0:
+                total *= Search(vars, self.constraints, graph, options).count()
+            if total == 0:
+                break
+        self._set_status(total > 0, limits)
+        return total
+
+    def solve_iter(self, options: Dict[str, Any]=dict(), top: Optional[int]=None) -> Iterator[ElementDict]:
+        """Yields every solution as soon as it's found, without keeping them.
+        With `top`, keeps only the `top` best solutions by objective in a bounded heap, and yields them best first when the search ends."""
+        if top is not None:
+            if self.objective is None:
+                raise RuntimeError("Can't keep the best solutions without objective.")
+            if top < 1:
+                raise ValueError("The amount of best solutions must be positive.")
+        if self.objective is not None:
+            self.objective.reset_optimal()
+        if len(self.vars) == 0:
+            if self.constraints({}):
+                yield dict(self.removed_vars)
+            return
+        # with top, the worst kept value prunes the search like the incumbent of optimal mode
+        search = Search(self.vars, self.constraints, self.generate_graph(), options, self.objective if top is not None else None)
+        assignments = iter(search)
+        try:
+            if top is None:
+                for values in assignments:
+                    yield {**dict(zip(self.vars, values)), **self.removed_vars}
+                return
+            sign = 1 if isinstance(self.objective, Maximize) else -1
+            # heap[0] is the worst solution kept, ties are broken in favour of the first found
+            heap: List[Tuple[Number, int, Tuple[Number, ...]]] = list()
+            for found, values in enumerate(assignments):
+                item = (sign * search.compiled_objective(values), -found, values)
+                if len(heap) < top:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+                else:
+                    continue
+                if len(heap) == top:
+                    self.objective.last_optimal = sign * heap[0][0]
+        finally:
+            assignments.close()
+        for _, _, values in sorted(heap, reverse=True):
+            yield {**dict(zip(self.vars, values)), **self.removed_vars}
+
+
+
+def node_consistency(var: IntVar, constr: VarsComparison, trail: Optional[Trail]=None) -> Tuple[bool, int]:
     """Apply node consistency to the var, and returns True if just only 1 element is left in it's domain, and the amount of removed values."""
     assert(len(constr.get_vars()) == 1)
-    values_removed = 0
-    for i in set(var.get_domain()):
-        if not constr(i):
-            var.remove_from_domain(i)
-            values_removed += 1
     domain = var.get_domain()
+    supported = None
+    if can_batch([constr], [domain]):
+        array = domain.as_array()
+        supported = batch_call(constr.compile({var: 0}), [array])
+    if supported is not None:
+        values_removed = domain.retain(numpy.broadcast_to(supported, array.shape), trail)
+    else:
+        removed = [i for i in domain if not constr(i)]
+        for i in removed:
+            var.remove_from_domain(i, trail)
+        values_removed = len(removed)
     if len(domain) == 0:
         raise RuntimeError("Variable "+var.get_expr()+" has empty domain after node consistency.")
     return (len(domain) == 1, values_removed)
 
-def arc_consistency(var1: IntVar, var2: IntVar, constr: VarsComparison) -> Tuple[bool, bool, int, int]:
+def arc_consistency(var1: IntVar, var2: IntVar, constr: VarsComparison, trail: Optional[Trail]=None) -> Tuple[bool, bool, int, int]:
     """Apply arc consistency to both vars, and returns True if just only 1 element is left for each of it's domains, and the amount of removed values for each variable."""
     assert(len(constr.get_vars()) == 2)
-    values_removed_1 = 0
-    for i in set(var1.get_domain()):
-        remove = True
-        for j in set(var2.get_domain()):
-            if constr({var1: i, var2: j}):
-                remove = False
-                break
-        if remove:
-            var1.remove_from_domain(i)
-            values_removed_1 += 1
-
-    values_removed_2 = 0
-    for j in set(var2.get_domain()):
-        remove = True
-        for i in set(var1.get_domain()):
-            if constr({var1: i, var2: j}):
-                remove = False
-                break
-        if remove:
-            var2.remove_from_domain(j)
-            values_removed_2 += 1
-    
     domain1 = var1.get_domain()
     domain2 = var2.get_domain()
+    supports1, supports2 = None, None
+    if can_batch([constr], [domain1, domain2]):
+        array1 = domain1.as_array()
+        array2 = domain2.as_array()
+        supports1, supports2 = batch_arc_supports(constr.compile({var1: 0, var2: 1}), array1, array2)
+
+    if supports1 is not None:
+        values_removed_1 = domain1.retain(supports1, trail)
+        values_removed_2 = domain2.retain(supports2, trail)
+    else:
+        values2 = list(domain2)
+        removed1 = [i for i in domain1 if not any(constr({var1: i, var2: j}) for j in values2)]
+        for i in removed1:
+            var1.remove_from_domain(i, trail)
+        # supports of the second variable are looked for among the values left in the first one
+        values1 = list(domain1)
+        removed2 = [j for j in values2 if not any(constr({var1: i, var2: j}) for i in values1)]
+        for j in removed2:
+            var2.remove_from_domain(j, trail)
+        values_removed_1, values_removed_2 = len(removed1), len(removed2)
+
     if len(domain1) == 0:
         raise RuntimeError("Variable "+var1.get_expr()+" has empty domain after arc consistency.")
     elif len(domain2) == 0:
         raise RuntimeError("Variable "+var2.get_expr()+" has empty domain after arc consistency.")
     return (len(domain1) == 1, len(domain2) == 1, values_removed_1, values_removed_2)
-    
\ No newline at end of file
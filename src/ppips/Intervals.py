@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+from math import isnan, log2
+from typing import Tuple, Union
+
+Number = Union[int, float]
+Interval = Tuple[Number, Number]
+
+INF = float("inf")
+UNBOUNDED: Interval = (-INF, INF)
+
+# Exact powers bigger than this amount of bits are replaced by infinity.
+MAX_POWER_BITS = 4096
+
+
+def point(value: Number) -> Interval:
+    return (value, value)
+
+def scale(a: Interval, factor: Number) -> Interval:
+    if factor == 0:
+        return (0, 0)
+    if factor > 0:
+        return (a[0]*factor, a[1]*factor)
+    return (a[1]*factor, a[0]*factor)
+
+def add(a: Interval, b: Interval) -> Interval:
+    lo = a[0] + b[0]
+    hi = a[1] + b[1]
+    if isnan(lo) or isnan(hi):
+        return UNBOUNDED
+    return (lo, hi)
+
+def _product(x: Number, y: Number) -> Number:
+    # 0 * inf is nan, but a zero bound means that factor is exactly 0
+    if x == 0 or y == 0:
+        return 0
+    return x*y
+
+def mul(a: Interval, b: Interval) -> Interval:
+    products = [_product(x, y) for x in a for y in b]
+    return (min(products), max(products))
+
+def div(a: Interval, b: Interval) -> Interval:
+    if b[0] <= 0 <= b[1]:
+        return UNBOUNDED
+    quotients = [x/y for x in a for y in b]
+    if any(isnan(x) for x in quotients):
+        return UNBOUNDED
+    return (min(quotients), max(quotients))
+
+def _power(base: Number, exponent: Number) -> Number:
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and base not in (-1, 0, 1):
+        if exponent * log2(abs(base)) > MAX_POWER_BITS:
+            return INF if base > 0 or exponent % 2 == 0 else -INF
+    try:
+        return base ** exponent
+    except OverflowError:
+        return INF if base > 0 or exponent % 2 == 0 else -INF
+
+def power(a: Interval, b: Interval) -> Interval:
+    lo, hi = a
+    if b[0] == b[1] and abs(b[0]) != INF and b[0] == int(b[0]):
+        k = int(b[0])
+        if k == 0:
+            return (1, 1)
+        if k > 0:
+            if k % 2 == 1 or lo >= 0:
+                return (_power(lo, k), _power(hi, k))
+            if hi <= 0:
+                return (_power(hi, k), _power(lo, k))
+            return (0, max(_power(lo, k), _power(hi, k)))
+        if lo > 0 or hi < 0:
+            # monotonic on each side of 0
+            ends = (_power(lo, k), _power(hi, k))
+            return (min(ends), max(ends))
+        return UNBOUNDED
+    if lo > 0:
+        # x**y is monotonic on each argument when x > 0
+        corners = [_power(x, y) for x in a for y in b]
+        if any(isinstance(x, complex) or isnan(x) for x in corners):
+            return UNBOUNDED
+        return (min(corners), max(corners))
+    return UNBOUNDED
+
+def mod(a: Interval, b: Interval) -> Interval:
+    if b[0] > 0:
+        if a[0] >= 0:
+            if a[1] < b[0]:
+                return a
+            return (0, min(a[1], b[1]))
+        return (0, b[1])
+    if b[1] < 0:
+        if a[1] <= 0:
+            if a[0] > b[1]:
+                return a
+            return (max(a[0], b[0]), 0)
+        return (b[0], 0)
+    return (min(b[0], 0), max(b[1], 0))
+
+def compare(a: Interval, b: Interval, comp_type: str) -> Union[bool, None]:
+    """Result of comparing every value of `a` with every value of `b`: True or False if it's always the same, None otherwise."""
+    if isnan(a[0]) or isnan(a[1]) or isnan(b[0]) or isnan(b[1]):
+        return None
+    if comp_type == "<":
+        if a[1] < b[0]:
+            return True
+        if a[0] >= b[1]:
+            return False
+    elif comp_type == "<=":
+        if a[1] <= b[0]:
+            return True
+        if a[0] > b[1]:
+            return False
+    elif comp_type == ">":
+        if a[0] > b[1]:
+            return True
+        if a[1] <= b[0]:
+            return False
+    elif comp_type == ">=":
+        if a[0] >= b[1]:
+            return True
+        if a[1] < b[0]:
+            return False
+    elif comp_type == "==":
+        if a[0] == a[1] == b[0] == b[1]:
+            return True
+        if a[1] < b[0] or a[0] > b[1]:
+            return False
+    elif comp_type == "!=":
+        if a[1] < b[0] or a[0] > b[1]:
+            return True
+        if a[0] == a[1] == b[0] == b[1]:
+            return False
+    else:
+        raise RuntimeError("Undefined comparison.")
+    return None
@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import List, Tuple, Dict, Union, Optional
+
+Number = Union[int, float]
+# (slot, value) pairs that can't be part of a solution together, sorted by slot
+Nogood = Tuple[Tuple[int, Number], ...]
+
+# Nogoods kept by default, each one of at most NOGOOD_MAX_SIZE pairs.
+NOGOOD_CAPACITY = 2**14
+# Larger conflict sets are rarely repeated, so they aren't learned.
+NOGOOD_MAX_SIZE = 8
+
+
+class NogoodStore:
+    """Partial assignments learned to have no solution, found by the pair of slot and value that each one contains.
+    Holds at most `capacity` of them, forgetting the one that went unused for longest."""
+    def __init__(self, capacity: int) -> None:
+        if not isinstance(capacity, int) or capacity < 0:
+            raise ValueError(f"Invalid nogood capacity {capacity!r}.")
+        self.capacity = capacity
+        # ordered from the least to the most recently used
+        self.nogoods: OrderedDict[Nogood, None] = OrderedDict()
+        self.watches: Dict[Tuple[int, Number], Dict[Nogood, None]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.nogoods)
+
+    def clear(self) -> None:
+        self.nogoods.clear()
+        self.watches.clear()
+
+    def add(self, nogood: Nogood) -> None:
+        if self.capacity == 0 or len(nogood) > NOGOOD_MAX_SIZE or nogood in self.nogoods:
+            return
+        if len(self.nogoods) >= self.capacity:
+            old, _ = self.nogoods.popitem(last=False)
+            for pair in old:
+                watch = self.watches[pair]
+                del watch[old]
+                if len(watch) == 0:
+                    del self.watches[pair]
+        self.nogoods[nogood] = None
+        for pair in nogood:
+            self.watches.setdefault(pair, dict())[nogood] = None
+
+    def find(self, slot: int, value: Number, values: List[Optional[Number]]) -> Optional[Nogood]:
+        """A nogood with the value of the slot whose other pairs are all in `values`, None if there isn't one."""
+        watch = self.watches.get((slot, value))
+        if watch is None:
+            return None
+        for nogood in watch:
+            if all(values[i] == v for i, v in nogood):
+                self.nogoods.move_to_end(nogood)
+                return nogood
+        return None
@@ -2,14 +2,18 @@
 
 from __future__ import annotations
 
-from typing import overload, Dict, Union
+from typing import overload, Dict, Union, Optional, Callable, Sequence, Any
 
 from .VarsOperations import ArithmeticElement, AbstractVar
+from .Util import evaluate_batch, EXACT_FLOAT_LIMIT
+from .Intervals import Interval
 
 Number = Union[int, float]
 Element = Union[AbstractVar, Number]
 ElementDict = Dict[Union[AbstractVar, str], Number]
 ArithElement = Union[ArithmeticElement, Number]
+SlotsDict = Dict[AbstractVar, int]
+BoundsDict = Dict[AbstractVar, Interval]
 
 class Optimize:
     def __init__(self, objective: ArithElement, default_optimal: Number) -> None:
@@ -20,6 +24,13 @@ class Optimize:
         self.objective: ArithElement = objective
         self.default_optimal = default_optimal
         self.last_optimal = default_optimal
+        # multiprocessing.Value with the best value found by any process
+        self.shared = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state["shared"] = None
+        return state
 
     def __str__(self) -> str:
         value = f"<{self.__class__.__name__}: "
@@ -35,6 +46,17 @@ class Optimize:
             return self.objective(vars_dict)
         return self.objective
     
+    def compile(self, slots: SlotsDict) -> Callable[[Sequence[Number]], Number]:
+        """Compiles the objective into a flat function of the slot array."""
+        if isinstance(self.objective, ArithmeticElement):
+            return self.objective.compile(slots)
+        objective = self.objective
+        return lambda values: objective
+
+    def evaluate_batch(self, values, vars: Sequence[AbstractVar]):
+        """Value of the objective for each row of `values`, a 2-D array with one column per variable of `vars`."""
+        return evaluate_batch(self.compile({var: i for i, var in enumerate(vars)}), values, len(vars))
+
     def update(self, vars_dict: ElementDict) -> None:
         if isinstance(self.objective, ArithmeticElement):
             self.objective = self.objective(vars_dict)
@@ -48,23 +70,78 @@ class Optimize:
     def is_better_than_optimal(self, other: Number) -> bool:
         raise NotImplementedError()
 
+    def get_bounds(self, bounds: Optional[BoundsDict]=None) -> Interval:
+        """Interval containing every value of the objective within the current domains, or the bounds of `bounds` for its variables."""
+        if isinstance(self.objective, ArithmeticElement):
+            return self.objective.get_bounds(bounds)
+        return (self.objective, self.objective)
+
+    def share(self, shared) -> None:
+        """Exchanges the best value found with other processes through `shared`, a multiprocessing.Value of a double."""
+        self.shared = shared
+
+    def publish(self) -> None:
+        """Writes the best value found to the shared one, if it's better and exact as a float."""
+        if self.shared is None or not abs(self.last_optimal) < EXACT_FLOAT_LIMIT:
+            return
+        with self.shared.get_lock():
+            if self.is_better(self.last_optimal, self.shared.value):
+                self.shared.value = self.last_optimal
+
+    def is_better(self, value: Number, other: Number) -> bool:
+        raise NotImplementedError()
+
+    def can_improve(self) -> bool:
+        """False if the bounds of the objective show that it can't reach the best value found, here or by another process."""
+        if self.shared is not None:
+            self.is_better_than_optimal(self.shared.value)
+        if self.last_optimal == self.default_optimal:
+            return True
+        return self.can_reach(self.get_bounds())
+
+    def can_reach(self, bounds: Interval) -> bool:
+        raise NotImplementedError()
+
+    def rank(self, bounds: Interval) -> Number:
+        """Smaller for bounds of the objective that can reach better values."""
+        raise NotImplementedError()
+
 
 class Minimize(Optimize):
     def __init__(self, objective: ArithElement) -> None:
         super().__init__(objective, float("inf"))
 
+    def is_better(self, value: Number, other: Number) -> bool:
+        return value < other
+
     def is_better_than_optimal(self, other: Number) -> bool:
         if other < self.last_optimal:
             self.last_optimal = other
             return True
         return False
 
+    def can_reach(self, bounds: Interval) -> bool:
+        # ties are kept, every optimal solution is returned
+        return not bounds[0] > self.last_optimal
+
+    def rank(self, bounds: Interval) -> Number:
+        return bounds[0]
+
 class Maximize(Optimize):
     def __init__(self, objective: ArithElement) -> None:
         super().__init__(objective, -float("inf"))
 
+    def is_better(self, value: Number, other: Number) -> bool:
+        return value > other
+
     def is_better_than_optimal(self, other: Number) -> bool:
         if other > self.last_optimal:
             self.last_optimal = other
             return True
         return False
+
+    def can_reach(self, bounds: Interval) -> bool:
+        return not bounds[1] < self.last_optimal
+
+    def rank(self, bounds: Interval) -> Number:
+        return -bounds[1]
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+from random import Random
+from typing import List, Dict, Set, Tuple, Union, Optional
+
+from .Variables import IntVar, IntVarContainer, Domain
+from .VarsOperations import ArithmeticElement, AbstractVar, LinearExpr, get_element_vars
+from .Constraints import CompiledConstraint
+from .Optimize import Optimize
+from .Relaxation import LinearRelaxation
+
+Number = Union[int, float]
+VarsGraph = Dict[IntVar, Set[IntVar]]
+
+VAR_ORDERS = ("input", "mrv", "degree", "dom_wdeg", "most_fractional", "pseudo_cost")
+VALUE_ORDERS = ("ascending", "descending", "random", "objective", "lcv")
+
+
+class VarOrdering:
+    """Chooses the next variable to instance among the ones left.
+    input: declaration order. mrv: smallest domain first. degree: most neighbours left to instance first.
+    dom_wdeg: smallest ratio between the domain size and the weights of its constraints, which grow each time they fail.
+    most_fractional: value farthest from an integer in the point of the linear relaxation. pseudo_cost: largest estimated change
+    of the relaxed objective. Both need the relaxation, without it they choose the smallest domain. With `rng`, ties between the best slots are broken at random instead of by their order."""
+    def __init__(self, kind: str, vars_list: List[IntVarContainer], constr_slots: List[List[int]], graph: VarsGraph, rng: Optional[Random]=None) -> None:
+        if kind not in VAR_ORDERS:
+            raise ValueError(f"Invalid variable order {kind!r}.")
+        self.kind = kind
+        self.rng = rng
+        # linear relaxation of the search, solved at the node whose children are chosen
+        self.relaxation: Optional[LinearRelaxation] = None
+        self.domains: List[Domain] = [x.domain for x in vars_list]
+        self.constr_slots = constr_slots
+        self.weights: List[int] = [1] * len(constr_slots)
+        slots = {x.get_var(): i for i, x in enumerate(vars_list)}
+        self.neighbours: List[List[int]] = [sorted(slots[j] for j in graph.get(x.get_var(), set()) if j in slots) for x in vars_list]
+        # constraints of each slot
+        self.watches: List[List[int]] = [list() for x in vars_list]
+        for index, constr in enumerate(constr_slots):
+            for i in constr:
+                self.watches[i].append(index)
+
+    def select(self, order: List[int], depth: int, values: List[Optional[Number]]) -> None:
+        """Moves the best slot of `order[depth:]` to `order[depth]`."""
+        if self.kind == "input":
+            return
+        best = depth
+        best_score = self.score(order[depth], values)
+        ties = 1
+        for k in range(depth + 1, len(order)):
+            score = self.score(order[k], values)
+            if score < best_score:
+                best, best_score, ties = k, score, 1
+            elif self.rng is not None and score == best_score:
+                # each of the tied slots ends up chosen with the same probability
+                ties += 1
+                if self.rng.randrange(ties) == 0:
+                    best = k
+        order[depth], order[best] = order[best], order[depth]
+
+    def score(self, slot: int, values: List[Optional[Number]]) -> tuple:
+        size = len(self.domains[slot])
+        if self.kind == "mrv" or (self.kind in ("most_fractional", "pseudo_cost") and self.relaxation is None):
+            return (size,)
+        if self.kind == "most_fractional":
+            return (-self.relaxation.fraction(slot), size)
+        if self.kind == "pseudo_cost":
+            return (-self.relaxation.pseudo_score(slot), size)
+        if self.kind == "degree":
+            return (-sum(1 for i in self.neighbours[slot] if values[i] is None), size)
+        weight = 0
+        for index in self.watches[slot]:
+            if any(values[i] is None for i in self.constr_slots[index] if i != slot):
+                weight += self.weights[index]
+        return (size / weight if weight > 0 else float("inf"), size)
+
+    def fail(self, index: int) -> None:
+        """Registers that the constraint `index` caused a failure."""
+        self.weights[index] += 1
+
+
+class ValueOrdering:
+    """Chooses the order in which the values of a slot are tried.
+    ascending, descending. random: shuffled. objective: values whose bounds of the objective can reach the best value first,
+    so the first solutions found are good ones. lcv: least constraining value first, the one that leaves the most values
+    with support in the constraints that have one slot left to instance. Ties are broken at random with `rng`, or by ascending value."""
+    def __init__(self, kind: str, vars_list: List[IntVarContainer], compiled: List[CompiledConstraint], values: List[Optional[Number]],
+                 objective: Optional[Optimize]=None, rng: Optional[Random]=None) -> None:
+        if kind not in VALUE_ORDERS:
+            raise ValueError(f"Invalid value order {kind!r}.")
+        if kind == "random" and rng is None:
+            raise ValueError("The random value order needs a seed.")
+        self.kind = kind
+        self.rng = rng
+        # slot array of the search, a slot is instanced when its value isn't None
+        self.values = values
+        self.vars: List[IntVar] = [x.get_var() for x in vars_list]
+        self.domains: List[Domain] = [x.domain for x in vars_list]
+        self.objective = objective
+        # slots that the value of the objective depends on
+        self.objective_slots: Set[int] = set()
+        # coefficients of the slots that are only a linear term of the objective, ranked without its bounds
+        self.coefficients: Dict[int, Number] = dict()
+        if objective is not None and isinstance(objective.objective, ArithmeticElement):
+            objective_vars = get_element_vars(objective.objective)
+            self.objective_slots = {i for i, x in enumerate(self.vars) if x in objective_vars}
+            if isinstance(objective.objective, LinearExpr):
+                terms = objective.objective.get_terms()
+                nested: Set[AbstractVar] = set()
+                for term in terms:
+                    if not isinstance(term, AbstractVar):
+                        nested |= get_element_vars(term)
+                self.coefficients = {i: terms[x] for i, x in enumerate(self.vars) if x in terms and x not in nested}
+        self.functions = [function for function, constr_slots in compiled]
+        self.slots: List[List[int]] = [sorted(set(constr_slots)) for function, constr_slots in compiled]
+        # constraints of each slot
+        self.watches: List[List[int]] = [list() for x in vars_list]
+        for index, constr_slots in enumerate(self.slots):
+            for i in constr_slots:
+                self.watches[i].append(index)
+
+    def order(self, slot: int, domain: Domain) -> List[Number]:
+        """Values of the domain of the slot, in the order to try them."""
+        values = list(domain)
+        if self.kind == "ascending":
+            return values
+        if self.kind == "descending":
+            values.reverse()
+            return values
+        if self.rng is not None:
+            self.rng.shuffle(values)
+        if self.kind == "objective" and slot in self.coefficients:
+            coeff = self.coefficients[slot]
+            values.sort(key=lambda value: self.objective.rank((coeff * value, coeff * value)))
+        elif self.kind == "objective" and slot in self.objective_slots:
+            var = self.vars[slot]
+            values.sort(key=lambda value: self.objective.rank(self.objective.get_bounds({var: (value, value)})))
+        elif self.kind == "lcv":
+            pending = self._pending(slot)
+            values.sort(key=lambda value: -self.supports(slot, value, pending))
+        return values
+
+    def _pending(self, slot: int) -> List[Tuple[int, int]]:
+        """Constraints of the slot that its value leaves with one slot to instance, and that slot."""
+        pending = list()
+        for index in self.watches[slot]:
+            future = [i for i in self.slots[index] if self.values[i] is None and i != slot]
+            if len(future) == 1:
+                pending.append((index, future[0]))
+        return pending
+
+    def supports(self, slot: int, value: Number, pending: List[Tuple[int, int]]) -> int:
+        """Amount of values of the other slots of `pending` that the constraints allow with the value."""
+        values = self.values
+        values[slot] = value
+        total = 0
+        for index, other in pending:
+            function = self.functions[index]
+            for other_value in self.domains[other]:
+                values[other] = other_value
+                if function(values):
+                    total += 1
+            values[other] = None
+        values[slot] = None
+        return total
@@ -0,0 +1,229 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+import multiprocessing
+import pickle
+import queue
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from typing import List, Tuple, Dict, Set, Union, Optional, Callable, Any
+
+from .Variables import IntVar, Trail
+from .Constraints import Constraints
+from .Optimize import Optimize
+from .Search import Search, Limits
+
+Number = Union[int, float]
+VarsGraph = Dict[IntVar, Set[IntVar]]
+Solution = Tuple[Number, ...]
+
+# Subproblems made per process, so the ones that finish early take the rest of the work.
+TASKS_PER_WORKER = 16
+# Smallest search space split among processes, below it starting them costs more than the search.
+PARALLEL_MIN_SPACE = 2**12
+
+# Configurations raced by default by solve_portfolio, each one strong on different kinds of models.
+PORTFOLIO: Tuple[Dict[str, Any], ...] = (
+    {},
+    {"var_order": "dom_wdeg", "propagation": "forward_checking"},
+    {"var_order": "mrv", "propagation": "mac"},
+    {"var_order": "degree", "cbj": True},
+)
+# Seconds between checks that the racing processes are still alive.
+RACE_POLL_INTERVAL = 0.1
+
+# search of each worker process, and the trail that instances the variables of its subproblem
+_worker: Optional[Tuple[Search, List[IntVar], str, Trail, Optional[Limits]]] = None
+
+
+def get_workers(options: Dict[str, Any]) -> int:
+    """Amount of processes requested by the "workers" option."""
+    workers = options.get("workers", 1)
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError(f"Invalid amount of workers {workers!r}.")
+    return workers
+
+def can_parallelize(vars: List[IntVar], options: Dict[str, Any]) -> bool:
+    """True if more than one worker was requested and the search space is worth splitting.
+    Node and solution limits count the nodes and solutions in order, so they keep the search in one process."""
+    if get_workers(options) <= 1:
+        return False
+    if options.get("node_limit") is not None or options.get("solution_limit") is not None:
+        return False
+    space = 1
+    for x in vars:
+        space *= len(x.get_domain())
+        if space >= PARALLEL_MIN_SPACE:
+            return True
+    return False
+
+def solve_parallel(vars: List[IntVar], constraints: Constraints, graph: VarsGraph, options: Dict[str, Any], solutions_type: str, objective: Optional[Optimize]=None,
+                   limits: Optional[Limits]=None, callback: Optional[Callable[[Number, Solution], None]]=None) -> Union[List[Solution], int]:
+    """Solves over `vars` with a pool of processes, each subproblem fixing the first variables to one combination of their values.
+    Returns the value tuples of the solutions in the same order as a single search with the input order, or their amount when counting.
+    In optimal mode, only the best ones are returned, and the processes share the best value found to prune their searches.
+    Every process stops at the deadline of `limits`, and `callback` is called with each better value received and one of its solutions."""
+    workers = get_workers(options)
+    size = 0
+    tasks = 1
+    while size < len(vars) and tasks < workers * TASKS_PER_WORKER:
+        tasks *= len(vars[size].get_domain())
+        size += 1
+    prefixes = list(product(*(list(x.get_domain()) for x in vars[:size])))
+    shared = None
+    if solutions_type == "optimal":
+        objective.reset_optimal()
+        shared = multiprocessing.Value("d", objective.default_optimal)
+    # set once a solution is found in first mode, so the running searches stop too
+    stop = multiprocessing.Value("b", 0, lock=False) if solutions_type == "first" else None
+    # the callback stays in this process
+    options = {key: value for key, value in options.items() if key != "on_improvement"}
+    payload = pickle.dumps((vars, constraints, graph, options, solutions_type, objective, limits))
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(payload, shared, stop))
+    futures: List[Any] = list()
+    first: List[Solution] = list()
+    try:
+        futures = [pool.submit(_solve_prefix, prefix) for prefix in prefixes]
+        positions = {future: i for i, future in enumerate(futures)}
+        results: List[Any] = [None] * len(futures)
+        for future in as_completed(futures):
+            result, reached = future.result()
+            if reached:
+                limits.reached = True
+            if solutions_type == "first" and len(result) > 0:
+                first = result
+                break
+            if solutions_type == "optimal" and result[0] is not None and objective.is_better_than_optimal(result[0]) and callback is not None:
+                callback(result[0], result[1][0])
+            results[positions[future]] = result
+    finally:
+        if stop is not None:
+            # the running searches return within DEADLINE_CHECK_INTERVAL nodes
+            stop.value = 1
+        _shutdown(pool, futures)
+
+    if solutions_type == "first":
+        return first
+    if solutions_type == "count":
+        return sum(results)
+    if solutions_type == "all":
+        return [solution for solutions in results for solution in solutions]
+    return [solution for value, solutions in results if value is not None and objective.is_optimal(value) for solution in solutions]
+
+def _shutdown(pool: ProcessPoolExecutor, futures: List[Any]) -> None:
+    """Shuts the pool down, cancelling the tasks that haven't started and waiting for the running ones."""
+    for future in futures:
+        future.cancel()
+    if sys.version_info >= (3, 9):
+        pool.shutdown(wait=True, cancel_futures=True)
+    else:
+        pool.shutdown(wait=True)
+
+def _init_worker(payload: bytes, shared: Optional[Any], stop: Optional[Any]) -> None:
+    global _worker
+    vars, constraints, graph, options, solutions_type, objective, limits = pickle.loads(payload)
+    if objective is not None:
+        objective.share(shared)
+    if stop is not None:
+        if limits is None:
+            limits = Limits(dict())
+        limits.stop = stop
+    search = Search(vars, constraints, graph, options, objective if solutions_type == "optimal" else None, limits)
+    _worker = (search, vars, solutions_type, Trail(), limits)
+
+def _solve_prefix(prefix: Solution) -> Tuple[Any, bool]:
+    """Solves the subproblem of the worker in which the first variables take the values of `prefix`.
+    Returns its answer, and True if the deadline or the stop flag stopped it."""
+    search, vars, solutions_type, trail, limits = _worker
+    if limits is not None:
+        limits.reached = False
+    return _solve_subproblem(search, vars, solutions_type, trail, prefix), limits is not None and limits.reached
+
+def _solve_subproblem(search: Search, vars: List[IntVar], solutions_type: str, trail: Trail, prefix: Solution) -> Any:
+    trail.push_level()
+    assignments = None
+    try:
+        for var, value in zip(vars, prefix):
+            var.get_domain().assign(value, trail)
+        if solutions_type == "count":
+            return search.count()
+        solutions: List[Solution] = list()
+        best = None
+        objective = search.objective
+        assignments = iter(search)
+        for values in assignments:
+            if solutions_type == "optimal":
+                value = search.compiled_objective(values)
+                if objective.is_better_than_optimal(value):
+                    objective.publish()
+                    solutions = [values]
+                    best = value
+                elif objective.is_optimal(value):
+                    if best is not None and best != value:
+                        # another process found a better value than the solutions kept
+                        solutions = list()
+                    solutions.append(values)
+                    best = value
+                continue
+            solutions.append(values)
+            if solutions_type == "first":
+                break
+        if solutions_type == "optimal":
+            return (best, solutions)
+        return solutions
+    finally:
+        if assignments is not None:
+            # the search reverts its own changes to the domains first
+            assignments.close()
+        trail.pop_level()
+
+def race(problem: Any, solutions_type: str, configs: List[Dict[str, Any]]) -> Tuple[int, Any, Optional[str]]:
+    """Solves a pickled copy of the problem once per configuration, each in its own process.
+    Returns the index of the first configuration to finish, its answer and its status. The answer is the amount of solutions when counting,
+    or the value tuples of the variables of the problem. The other processes are stopped. In optimal mode they share the best value found."""
+    context = multiprocessing.get_context()
+    shared = None
+    if solutions_type == "optimal":
+        shared = context.Value("d", problem.objective.default_optimal)
+    results = context.Queue()
+    payload = pickle.dumps(problem)
+    processes = [context.Process(target=_race_config, args=(payload, solutions_type, config, index, shared, results), daemon=True) for index, config in enumerate(configs)]
+    for process in processes:
+        process.start()
+    try:
+        while True:
+            try:
+                index, answer, status = results.get(timeout=RACE_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    raise RuntimeError("Every process of the portfolio stopped without an answer.")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+    if isinstance(answer, BaseException):
+        raise answer
+    return index, answer, status
+
+def _race_config(payload: bytes, solutions_type: str, config: Dict[str, Any], index: int, shared: Optional[Any], results: Any) -> None:
+    status = None
+    try:
+        problem = pickle.loads(payload)
+        if shared is not None:
+            problem.objective.share(shared)
+            # the shared value is the one of the whole objective, not of a component
+            config = {**config, "decompose": False}
+        solutions = problem.solve(solutions_type, config)
+        if solutions_type == "count":
+            answer = solutions
+        else:
+            answer = [tuple(solution[x] for x in problem.vars) for solution in solutions]
+        status = problem.status
+    except Exception as e:
+        answer = e
+    results.put((index, answer, status))
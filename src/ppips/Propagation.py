@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+from typing import List, Dict, Set, Union, Optional, Callable, Sequence
+
+from .Variables import IntVarContainer, Domain, Trail
+from .Constraints import CompiledConstraint
+
+Number = Union[int, float]
+
+PROPAGATION_LEVELS = ("none", "forward_checking", "mac")
+
+
+class Propagator:
+    """Prunes the domains of the variables that aren't instanced yet, after each decision of the search.
+    A slot is instanced when its value isn't None. Removals are recorded in the trail, so they are reverted along with the decision."""
+    def __init__(self, level: str, vars_list: List[IntVarContainer], compiled: List[CompiledConstraint], trail: Trail) -> None:
+        if level not in PROPAGATION_LEVELS:
+            raise ValueError(f"Invalid propagation level {level!r}.")
+        self.level = level
+        self.trail = trail
+        self.domains: List[Domain] = [x.domain for x in vars_list]
+        self.functions: List[Callable[[Sequence[Optional[Number]]], bool]] = list()
+        self.slots: List[List[int]] = list()
+        # constraint that emptied a domain in the last propagation
+        self.conflict: Optional[int] = None
+        # constraints of each slot
+        self.watches: List[List[int]] = [list() for x in vars_list]
+        for function, constr_slots in compiled:
+            constr_slots = sorted(set(constr_slots))
+            index = len(self.functions)
+            self.functions.append(function)
+            self.slots.append(constr_slots)
+            for i in constr_slots:
+                self.watches[i].append(index)
+
+    def propagate(self, instanced: int, values: List[Optional[Number]]) -> bool:
+        """Prunes the domains after instancing the slot `instanced`, or with every constraint if it's -1.
+        Returns False if a domain was left empty."""
+        if instanced < 0:
+            changed = range(len(self.functions))
+        else:
+            changed = self.watches[instanced]
+        # arcs (constraint, slot) whose slot may have lost supports
+        queue = [(index, slot) for index in changed for slot in self.slots[index] if values[slot] is None]
+        queued = set(queue)
+        maintain = self.level == "mac"
+        while len(queue) > 0:
+            index, slot = queue.pop()
+            queued.discard((index, slot))
+            future = [i for i in self.slots[index] if values[i] is None]
+            if len(future) == 1 or (maintain and len(future) == 2):
+                removed = self.revise(index, slot, future, values)
+                if removed is None:
+                    self.conflict = index
+                    return False
+                if removed > 0 and maintain:
+                    for other in self.watches[slot]:
+                        if other == index:
+                            continue
+                        for other_slot in self.slots[other]:
+                            if values[other_slot] is None and other_slot != slot and (other, other_slot) not in queued:
+                                queued.add((other, other_slot))
+                                queue.append((other, other_slot))
+        return True
+
+    def revise(self, index: int, slot: int, future: List[int], values: List[Optional[Number]]) -> Optional[int]:
+        """Removes the values of the slot without support in the constraint. Returns the amount removed, or None if none is left."""
+        function = self.functions[index]
+        domain = self.domains[slot]
+        removed: List[Number] = list()
+        if len(future) == 1:
+            for value in domain:
+                values[slot] = value
+                if not function(values):
+                    removed.append(value)
+        else:
+            other = future[0] if future[1] == slot else future[1]
+            other_values = list(self.domains[other])
+            for value in domain:
+                values[slot] = value
+                for other_value in other_values:
+                    values[other] = other_value
+                    if function(values):
+                        break
+                else:
+                    removed.append(value)
+            values[other] = None
+        values[slot] = None
+        if len(removed) == len(domain):
+            return None
+        for value in removed:
+            domain.remove(value, self.trail)
+        return len(removed)
@@ -0,0 +1,334 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+from itertools import chain
+from math import ceil, floor, inf
+from typing import List, Tuple, Dict, Union, Optional, Any
+
+from .Variables import IntVar, IntDomain, Domain
+from .VarsComparison import VarsComparison
+from .VarsOperations import get_linear_form
+from .Optimize import Optimize, Maximize
+from .Intervals import Interval
+from .Util import numpy
+
+Number = Union[int, float]
+
+LP_BACKENDS = ("python", "numpy")
+# Tolerance of the simplex for reduced costs, pivots and ratios.
+LP_EPSILON = 1e-9
+# Sum of the artificial variables above which the relaxation has no feasible point.
+LP_FEASIBILITY = 1e-7
+# Relative margin given to the bounds of the relaxation, so rounding errors don't prune optimal solutions.
+LP_TOLERANCE = 1e-6
+# Most pivots of each phase of the simplex, past them the relaxation bounds nothing.
+LP_MAX_PIVOTS = 10000
+# Smallest tableau, in cells, solved with NumPy by default. Below it the Python lists are faster.
+LP_NUMPY_MIN_CELLS = 2**10
+
+
+def simplex(costs: List[float], rows: List[List[float]], rhs: List[float], equal: List[bool], upper: List[float], backend: str="python") -> Tuple[float, List[float]]:
+    """Minimizes costs·x subject to each row·x <= rhs, or == where `equal`, and 0 <= x <= upper, with the bounded primal simplex
+    over a dense tableau and Bland's rule. Returns the minimum and a point that reaches it. The minimum is inf if there is no
+    feasible point, and -inf without a point if the simplex ran out of pivots."""
+    if backend not in LP_BACKENDS:
+        raise ValueError(f"Invalid LP backend {backend!r}.")
+    n, m = len(costs), len(rows)
+    # columns: the variables, a slack for each row, fixed to 0 in equalities, and an artificial for each row that starts infeasible
+    table: List[List[float]] = list()
+    basis: List[int] = list()
+    values = [0.0] * (n + m)
+    bounds = [float(x) for x in upper] + [0.0 if eq else inf for eq in equal]
+    artificial: List[Tuple[int, float]] = list()
+    for i, (row, b, eq) in enumerate(zip(rows, rhs, equal)):
+        line = [float(a) for a in row] + [0.0] * m
+        line[n + i] = 1.0
+        if not eq and b >= 0:
+            basis.append(n + i)
+            values[n + i] = float(b)
+        else:
+            if b < 0:
+                line = [-a for a in line]
+            basis.append(-1)
+            artificial.append((i, abs(float(b))))
+        table.append(line)
+    for k, (i, b) in enumerate(artificial):
+        for r, line in enumerate(table):
+            line.append(1.0 if r == i else 0.0)
+        basis[i] = n + m + k
+        values.append(b)
+        bounds.append(inf)
+    if backend == "numpy":
+        iterate = _iterate_numpy
+        state: Any = (numpy.array(table, dtype=float).reshape(m, len(values)), numpy.array(values), numpy.array(bounds))
+    else:
+        iterate = _iterate_python
+        state = (table, values, bounds)
+
+    if len(artificial) > 0:
+        phase = [0.0] * (n + m) + [1.0] * len(artificial)
+        if not iterate(*state, basis, phase):
+            return -inf, []
+        if sum(float(x) for x in state[1][n + m:]) > LP_FEASIBILITY:
+            return inf, []
+        # the artificial variables can't leave 0 anymore
+        for c in range(n + m, len(bounds)):
+            state[1][c] = 0.0
+            state[2][c] = 0.0
+    if not iterate(*state, basis, list(costs) + [0.0] * (m + len(artificial))):
+        return -inf, []
+    point = [float(x) for x in state[1][:n]]
+    return sum(c * x for c, x in zip(costs, point)), point
+
+def _iterate_python(table: List[List[float]], values: List[float], bounds: List[float], basis: List[int], costs: List[float]) -> bool:
+    """Pivots from a feasible basis until no variable improves the costs. False if it ran out of pivots."""
+    m, columns = len(table), len(costs)
+    reduced = list(costs)
+    for i, b in enumerate(basis):
+        if costs[b] != 0:
+            reduced = [d - costs[b] * a for d, a in zip(reduced, table[i])]
+    basic = [False] * columns
+    for b in basis:
+        basic[b] = True
+    for _ in range(LP_MAX_PIVOTS):
+        # nonbasic variables are at one of their bounds, the first one whose move lowers the costs enters
+        j = -1
+        for c in range(columns):
+            if basic[c] or bounds[c] == 0:
+                continue
+            if (reduced[c] < -LP_EPSILON and values[c] < bounds[c]) or (reduced[c] > LP_EPSILON and values[c] > 0):
+                j = c
+                break
+        if j < 0:
+            return True
+        direction = 1.0 if reduced[j] < 0 else -1.0
+        step = bounds[j] - values[j] if direction > 0 else values[j]
+        ratios: List[Tuple[float, int, float]] = list()
+        for i in range(m):
+            alpha = table[i][j] * direction
+            b = basis[i]
+            if alpha > LP_EPSILON:
+                ratios.append((max(values[b] / alpha, 0.0), i, 0.0))
+            elif alpha < -LP_EPSILON and bounds[b] < inf:
+                ratios.append((max((bounds[b] - values[b]) / -alpha, 0.0), i, bounds[b]))
+        leave = -1
+        target = 0.0
+        if len(ratios) > 0:
+            least = min(ratio for ratio, i, bound in ratios)
+            if least < step - LP_EPSILON:
+                # ties leave by the smallest variable
+                step, leave, target = min(((ratio, i, bound) for ratio, i, bound in ratios if ratio <= least + LP_EPSILON), key=lambda r: basis[r[1]])
+        if step == inf:
+            return False
+        for i in range(m):
+            if table[i][j] != 0:
+                values[basis[i]] -= table[i][j] * direction * step
+        if leave < 0:
+            # the variable goes to its other bound, the basis stays
+            values[j] = bounds[j] if direction > 0 else 0.0
+            continue
+        values[j] += direction * step
+        old = basis[leave]
+        values[old] = target
+        basic[old], basic[j] = False, True
+        basis[leave] = j
+        pivot = table[leave][j]
+        row = [a / pivot for a in table[leave]]
+        table[leave] = row
+        for i in range(m):
+            factor = table[i][j]
+            if i != leave and factor != 0:
+                table[i] = [a - factor * r for a, r in zip(table[i], row)]
+        factor = reduced[j]
+        reduced = [d - factor * r for d, r in zip(reduced, row)]
+    return False
+
+def _iterate_numpy(table: Any, values: Any, bounds: Any, basis: List[int], costs: List[float]) -> bool:
+    """Same as _iterate_python, with each step over whole rows and columns of NumPy arrays."""
+    m = table.shape[0]
+    costs_array = numpy.array(costs)
+    rows = numpy.array(basis, dtype=int)
+    reduced = costs_array - costs_array[rows] @ table
+    basic = numpy.zeros(len(costs), dtype=bool)
+    basic[rows] = True
+    for _ in range(LP_MAX_PIVOTS):
+        movable = ~basic & (bounds != 0)
+        candidates = numpy.flatnonzero(movable & (((reduced < -LP_EPSILON) & (values < bounds)) | ((reduced > LP_EPSILON) & (values > 0))))
+        if len(candidates) == 0:
+            for i, b in enumerate(rows):
+                basis[i] = int(b)
+            return True
+        j = candidates[0]
+        direction = 1.0 if reduced[j] < 0 else -1.0
+        step = bounds[j] - values[j] if direction > 0 else values[j]
+        alpha = table[:, j] * direction
+        current = values[rows]
+        limits = bounds[rows]
+        ratios = numpy.full(m, inf)
+        targets = numpy.zeros(m)
+        down = alpha > LP_EPSILON
+        ratios[down] = current[down] / alpha[down]
+        up = (alpha < -LP_EPSILON) & (limits < inf)
+        ratios[up] = (limits[up] - current[up]) / -alpha[up]
+        targets[up] = limits[up]
+        ratios = numpy.maximum(ratios, 0.0)
+        leave = -1
+        if m > 0:
+            least = ratios.min()
+            if least < step - LP_EPSILON:
+                ties = numpy.flatnonzero(ratios <= least + LP_EPSILON)
+                leave = int(ties[numpy.argmin(rows[ties])])
+                step = ratios[leave]
+        if step == inf:
+            return False
+        values[rows] -= table[:, j] * direction * step
+        if leave < 0:
+            values[j] = bounds[j] if direction > 0 else 0.0
+            continue
+        values[j] += direction * step
+        old = rows[leave]
+        values[old] = targets[leave]
+        basic[old], basic[j] = False, True
+        rows[leave] = j
+        row = table[leave] / table[leave, j]
+        table -= numpy.outer(table[:, j], row)
+        table[leave] = row
+        reduced -= reduced[j] * row
+    return False
+
+
+class LinearRelaxation:
+    """Linear programming relaxation of the linear constraints and objective of a search, with the bounds of the domains.
+    Comparisons that aren't linear are left out, so its optimum bounds the objective of every solution left.
+    Also keeps the pseudo-costs of each slot: the average change of the relaxed objective per unit that its values move it."""
+    def __init__(self, domains: List[Domain], costs: List[Number], constant: Number, rows: List[List[Number]], rhs: List[Number], equal: List[bool],
+                 objective: Optimize, integral: bool, backend: str) -> None:
+        self.domains = domains
+        # the relaxation is a minimization, the sign turns maximizations into one
+        self.sign = -1 if isinstance(objective, Maximize) else 1
+        self.costs = [self.sign * c for c in costs]
+        self.constant = constant
+        self.rows = rows
+        self.rhs = rhs
+        self.equal = equal
+        self.objective = objective
+        # integer coefficients and values, so the objective is integer too
+        self.integral = integral
+        self.backend = backend
+        # minimum and point of the last relaxation solved, None if it had no point
+        self.minimum = -inf
+        self.point: Optional[List[float]] = None
+        # sum and amount of observations of the cost per unit of moving each slot down and up
+        self.pseudo_costs: List[List[float]] = [[0.0, 0, 0.0, 0] for x in domains]
+
+    def solve(self, values: List[Optional[Number]]) -> Optional[Interval]:
+        """Relaxes the problem with instanced slots fixed to their value. Returns the interval that it bounds the objective to,
+        None if it has no point."""
+        lower: List[Number] = list()
+        upper: List[float] = list()
+        for value, domain in zip(values, self.domains):
+            if value is not None:
+                lower.append(value)
+                upper.append(0.0)
+            else:
+                lower.append(domain.min())
+                upper.append(domain.max() - domain.min())
+        # moved to 0 <= x - lower <= upper
+        rhs = [b - sum(a * low for a, low in zip(row, lower) if a != 0) for row, b in zip(self.rows, self.rhs)]
+        self.minimum, shifted = simplex(self.costs, self.rows, rhs, self.equal, upper, self.backend)
+        if self.minimum == inf:
+            self.point = None
+            return None
+        if self.minimum == -inf:
+            self.point = None
+            return (-inf, inf)
+        self.point = [x + low for x, low in zip(shifted, lower)]
+        minimum = self.minimum + sum(c * low for c, low in zip(self.costs, lower))
+        self.minimum = minimum
+        minimum -= LP_TOLERANCE * (1 + abs(minimum))
+        if self.integral:
+            minimum = ceil(minimum)
+        bound = self.sign * minimum + self.constant
+        return (bound, inf) if self.sign > 0 else (-inf, bound)
+
+    def observe(self, slot: int, value: Number, parent: Tuple[float, Optional[List[float]]]) -> None:
+        """Updates the pseudo-costs of the slot with the relaxation solved after instancing it, against the one before."""
+        minimum, point = parent
+        if point is None or self.point is None:
+            return
+        moved = value - point[slot]
+        if abs(moved) <= LP_TOLERANCE:
+            return
+        costs = self.pseudo_costs[slot]
+        side = 0 if moved < 0 else 2
+        costs[side] += max(self.minimum - minimum, 0.0) / abs(moved)
+        costs[side + 1] += 1
+
+    def fraction(self, slot: int) -> float:
+        """Distance from the value of the slot in the last point to the nearest integer, 0 without a point."""
+        if self.point is None:
+            return 0.0
+        x = self.point[slot]
+        return min(x - floor(x), ceil(x) - x)
+
+    def pseudo_score(self, slot: int) -> float:
+        """Estimated change of the relaxed objective when branching on the slot, higher for the slots that decide more."""
+        if self.point is None:
+            return 0.0
+        x = self.point[slot]
+        down_sum, downs, up_sum, ups = self.pseudo_costs[slot]
+        # slots without observations are assumed to cost a unit
+        down = (down_sum / downs if downs > 0 else 1.0) * (x - floor(x))
+        up = (up_sum / ups if ups > 0 else 1.0) * (ceil(x) - x)
+        return max(down, LP_EPSILON) * max(up, LP_EPSILON)
+
+
+def build_relaxation(vars: List[IntVar], constrs: List[VarsComparison], objective: Optimize, backend: Optional[str]=None) -> Optional[LinearRelaxation]:
+    """Relaxation over `vars` of the linear ones of `constrs`. None if the objective isn't linear.
+    Without a backend, NumPy solves the ones with a tableau of at least LP_NUMPY_MIN_CELLS cells, if it's available."""
+    if backend is not None and backend not in LP_BACKENDS:
+        raise ValueError(f"Invalid LP backend {backend!r}.")
+    if backend == "numpy" and numpy is None:
+        raise RuntimeError("NumPy is needed for the numpy LP backend.")
+    slots = {x: i for i, x in enumerate(vars)}
+    form = get_linear_form(objective.objective)
+    if form is None or any(x not in slots for x in form[0]):
+        return None
+    domains = [x.get_domain() for x in vars]
+    integer_vars = [isinstance(domain, IntDomain) or all(isinstance(value, int) for value in domain) for domain in domains]
+    costs: List[Number] = [0] * len(vars)
+    for x, coeff in form[0].items():
+        costs[slots[x]] = coeff
+    integral = all(isinstance(c, int) for c in costs) and isinstance(form[1], int) and all(integer_vars[slots[x]] for x in form[0])
+    rows: List[List[Number]] = list()
+    rhs: List[Number] = list()
+    equal: List[bool] = list()
+    for constr in constrs:
+        left = get_linear_form(constr.left)
+        right = get_linear_form(constr.right)
+        if left is None or right is None or constr.comp_type == "!=" or any(x not in slots for x in chain(left[0], right[0])):
+            continue
+        # left - right compared with 0, as row·x compared with bound
+        row: List[Number] = [0] * len(vars)
+        for x, coeff in left[0].items():
+            row[slots[x]] += coeff
+        for x, coeff in right[0].items():
+            row[slots[x]] -= coeff
+        bound = right[1] - left[1]
+        comp_type = constr.comp_type
+        if comp_type in (">", ">="):
+            row = [-a for a in row]
+            bound = -bound
+            comp_type = "<" if comp_type == ">" else "<="
+        if comp_type == "<" and isinstance(bound, int) and all(isinstance(a, int) and (a == 0 or integer_vars[i]) for i, a in enumerate(row)):
+            # a strict comparison of integers is off by one
+            bound -= 1
+        rows.append(row)
+        rhs.append(bound)
+        equal.append(comp_type == "==")
+    if backend is None:
+        # a slack and at most an artificial variable per row
+        large = len(rows) * (len(vars) + 2 * len(rows)) >= LP_NUMPY_MIN_CELLS
+        backend = "numpy" if large and numpy is not None else "python"
+    return LinearRelaxation(domains, costs, form[1], rows, rhs, equal, objective, integral, backend)
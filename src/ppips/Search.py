@@ -0,0 +1,485 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+import time
+from functools import partial
+from math import inf
+from random import Random
+from typing import List, Tuple, Dict, Set, Union, Optional, Callable, Any, Iterator
+
+from .Variables import IntVar, IntVarContainer, Domain, IntDomain, Trail
+from .VarsComparison import VarsComparison
+from .Constraints import Constraints
+from .Optimize import Optimize
+from .Propagation import Propagator
+from .Ordering import VarOrdering, ValueOrdering
+from .Relaxation import LinearRelaxation, build_relaxation
+from .Nogoods import NogoodStore, NOGOOD_CAPACITY
+from .Util import numpy, EXACT_FLOAT_LIMIT
+
+Number = Union[int, float]
+VarsGraph = Dict[IntVar, Set[IntVar]]
+# index of the constraint, compiled check and the constraint
+Check = Tuple[int, Callable, VarsComparison]
+
+# Smallest domain for which the last variable of the search is filtered with NumPy.
+BATCH_MIN_SIZE = 32
+# Nodes between two reads of the clock when the search has a deadline, or of the stop flag.
+DEADLINE_CHECK_INTERVAL = 64
+
+RESTART_SCHEDULES = ("none", "luby", "geometric")
+# Nodes of the first run of a restart schedule, and the growth between runs of the geometric one.
+RESTART_BASE = 100
+RESTART_FACTOR = 1.5
+
+
+class Limits:
+    """Budget of a solve, read from the options "time_limit" (seconds of wall-clock time from now), "node_limit" (values tried)
+    and "solution_limit". Shared by every search of the solve, `reached` tells if one of them stopped early."""
+    def __init__(self, options: Dict[str, Any]) -> None:
+        for key in ("time_limit", "node_limit", "solution_limit"):
+            limit = options.get(key)
+            if limit is not None and (not isinstance(limit, (int, float)) or isinstance(limit, bool) or limit < 0):
+                raise ValueError(f"Invalid {key} {limit!r}.")
+        time_limit = options.get("time_limit")
+        self.deadline: Optional[float] = None if time_limit is None else time.monotonic() + time_limit
+        # amounts left, None without limit
+        self.nodes: Optional[int] = options.get("node_limit")
+        self.solutions: Optional[int] = options.get("solution_limit")
+        self.reached = False
+        # flag shared with other processes, set once they must stop
+        self.stop: Optional[Any] = None
+        # the clock is read on the first node
+        self.countdown = 0
+
+    def is_active(self) -> bool:
+        return self.deadline is not None or self.nodes is not None or self.solutions is not None
+
+    def node(self) -> bool:
+        """Counts a node of the search. False if a limit was reached before it."""
+        if self.nodes is not None:
+            if self.nodes == 0:
+                self.reached = True
+                return False
+            self.nodes -= 1
+        if self.deadline is not None or self.stop is not None:
+            self.countdown -= 1
+            if self.countdown <= 0:
+                self.countdown = DEADLINE_CHECK_INTERVAL
+                if (self.deadline is not None and time.monotonic() >= self.deadline) or (self.stop is not None and self.stop.value):
+                    self.reached = True
+                    return False
+        return not self.reached
+
+    def take(self, amount: int) -> int:
+        """Counts up to `amount` solutions found, returns how many of them fit in the solution limit."""
+        if self.solutions is None:
+            return amount
+        amount = min(amount, self.solutions)
+        self.solutions -= amount
+        if self.solutions == 0:
+            self.reached = True
+        return amount
+
+
+class Search:
+    """Depth-first search over one mutable slot array, driven by an explicit stack of decisions instead of recursion.
+    Iterating it yields the values of every complete assignment that satisfies the constraints, in slot order."""
+    def __init__(self, vars: List[IntVar], constraints: Constraints, graph: VarsGraph, options: Dict[str, Any], objective: Optional[Optimize]=None, limits: Optional[Limits]=None) -> None:
+        self.vars = vars
+        self.options = options
+        # with an objective, the subtrees that can't reach its best value are pruned
+        self.objective = objective
+        # the search stops once they are reached
+        self.limits = limits
+        self.trail = Trail()
+        self.containers = [IntVarContainer(x, self.trail) for x in vars]
+        slots = {x: i for i, x in enumerate(vars)}
+        compiled = constraints.compile(slots)
+        # same order as the compiled ones
+        constrs = [i for i in constraints if all(var in slots for var in constraints.get_vars(i))]
+        constr_slots = [sorted(set(x[1])) for x in compiled]
+        self.constr_slots = constr_slots
+        self.values: List[Optional[Number]] = [None] * len(vars)
+        self.arity: List[int] = [len(x) for x in constr_slots]
+        self.unsatisfiable = False
+        # checks[i] has every constraint of vars[i]
+        self.checks: List[List[Check]] = [list() for x in vars]
+        for index, ((check, _), constr) in enumerate(zip(compiled, constrs)):
+            if len(constr_slots[index]) == 0 and not check(self.values):
+                self.unsatisfiable = True
+            for i in constr_slots[index]:
+                self.checks[i].append((index, check, constr))
+        self.use_bounds = bool(options.get("bounds", False))
+        # with a seed, ties between variables and values are broken at random, and values are tried in random order by default
+        self.seed = options.get("seed")
+        self.rng: Optional[Random] = Random(self.seed) if self.seed is not None else None
+        self.ordering = VarOrdering(options.get("var_order", "input"), self.containers, constr_slots, graph, self.rng)
+        value_order = options.get("value_order", "random" if self.rng is not None else "ascending")
+        self.value_ordering: Optional[ValueOrdering] = None
+        if value_order != "ascending":
+            # the containers try the values in ascending order by themselves
+            self.value_ordering = ValueOrdering(value_order, self.containers, compiled, self.values, objective, self.rng)
+            for i, x in enumerate(self.containers):
+                x.value_order = partial(self.value_ordering.order, i)
+        self.restarts = options.get("restarts", "none")
+        if self.restarts not in RESTART_SCHEDULES:
+            raise ValueError(f"Invalid restart schedule {self.restarts!r}.")
+        self.restart_base = options.get("restart_base", RESTART_BASE)
+        if not isinstance(self.restart_base, int) or self.restart_base < 1:
+            raise ValueError(f"Invalid restart base {self.restart_base!r}.")
+        self.restart_factor = options.get("restart_factor", RESTART_FACTOR)
+        if not isinstance(self.restart_factor, (int, float)) or not self.restart_factor >= 1:
+            raise ValueError(f"Invalid restart factor {self.restart_factor!r}.")
+        self.propagator: Optional[Propagator] = None
+        level = options.get("propagation", "none")
+        if level != "none":
+            self.propagator = Propagator(level, self.containers, compiled, self.trail)
+        # removals made by MAC can't be explained with the neighbours of a variable
+        self.cbj = bool(options.get("cbj", False)) and level != "mac"
+        self.gbj = (bool(options.get("gbj", False)) or self.cbj) and level != "mac"
+        # partial assignments that conflict-directed backjumping proved to have no solution
+        self.nogoods: Optional[NogoodStore] = None
+        if self.cbj:
+            self.nogoods = NogoodStore(options.get("nogoods", NOGOOD_CAPACITY))
+        self.neighbours: List[List[int]] = [[slots[j] for j in graph.get(x, set()) if j in slots] for x in vars]
+        self.compiled_objective: Optional[Callable] = None
+        if objective is not None:
+            self.compiled_objective = objective.compile(slots)
+        # with a linear objective, the linear relaxation of each node bounds it too
+        self.relaxation: Optional[LinearRelaxation] = None
+        if objective is not None and options.get("lp", False):
+            self.relaxation = build_relaxation(vars, constrs, objective, options.get("lp_backend"))
+            self.ordering.relaxation = self.relaxation
+        # minimum and point of the relaxation at the root and at each depth, to update the pseudo-costs
+        self.relaxed: List[Tuple[float, Optional[List[float]]]] = [(-inf, None)] * (len(vars) + 1)
+        self.batch_domains: Optional[List[Any]] = None
+        self.batch_sizes: List[int] = list()
+        if can_batch(constrs, [x.domain for x in self.containers]):
+            self.batch_domains = [None] * len(vars)
+
+        # decision stack: order[d] is the slot instanced at depth d
+        self.order: List[int] = list(range(len(vars)))
+        self.position: List[int] = list(range(len(vars)))
+        # depths that explain the failures below each depth, for backjumping
+        self.jumps: List[Set[int]] = [set() for x in vars]
+        # depths that can only backtrack chronologically
+        self.chronological: List[bool] = [False] * len(vars)
+        # amount of slots of each constraint in the decision stack, and the checks of each depth:
+        # the constraints whose last slot is the one of that depth, and the ones that still have slots below it
+        self.stacked: List[int] = [0] * len(constr_slots)
+        self.due: List[List[Check]] = [list() for x in vars]
+        self.partial: List[List[Check]] = [list() for x in vars]
+        # yield the amount of solutions found instead of the solutions
+        self.counting = False
+
+    def __iter__(self) -> Iterator[Tuple[Number, ...]]:
+        try:
+            yield from self._search()
+        finally:
+            # the search may have stopped with variables instanced
+            for x in self.containers:
+                x.reset_instances()
+            self.trail.clear()
+            self.values[:] = [None] * len(self.values)
+
+    def count(self) -> int:
+        """Amount of complete assignments that satisfy the constraints, counted without building them."""
+        self.counting = True
+        try:
+            return sum(self)
+        finally:
+            self.counting = False
+
+    def _search(self) -> Iterator[Any]:
+        values = self.values
+        limits = self.limits
+        last = len(self.containers) - 1
+        self.stacked = [0] * len(self.arity)
+        if self.nogoods is not None:
+            # learned with the domains at the root of a previous search
+            self.nogoods.clear()
+        if self.rng is not None:
+            # the same search gives the same answer each time
+            self.rng.seed(self.seed)
+        # restarts stop at the first solution, so the last run is complete and yields nothing twice
+        cutoffs = restart_cutoffs(self.restarts, self.restart_base, self.restart_factor) if self.restarts != "none" else None
+        cutoff = next(cutoffs) if cutoffs is not None else None
+        run_nodes = 0
+        if self.unsatisfiable:
+            return
+        if self.propagator is not None:
+            # changes made before the first decision, reverted at the end of the search
+            self.trail.push_level()
+            if not self.propagator.propagate(-1, values):
+                return
+        if self.relaxation is not None and not self._relax(-1):
+            return
+        if self.batch_domains is not None:
+            # the domains at the root may differ from the ones of a previous search
+            self.batch_domains = [None] * len(self.containers)
+            self.batch_sizes = [len(x.domain) for x in self.containers]
+        if last < 0:
+            if limits is None or limits.take(1) > 0:
+                yield 1 if self.counting else ()
+            return
+
+        depth = 0
+        self._enter(depth)
+        while depth >= 0:
+            slot = self.order[depth]
+            var = self.containers[slot]
+            if depth == last and self.batch_domains is not None and len(var.domain) >= BATCH_MIN_SIZE:
+                if limits is not None and not limits.node():
+                    return
+                for solution in self._batch_solutions(slot, var):
+                    self._found(depth)
+                    cutoff = None
+                    if limits is not None:
+                        amount = limits.take(solution if self.counting else 1)
+                        if amount == 0:
+                            return
+                        solution = amount if self.counting else solution
+                    yield solution
+                    if limits is not None and limits.reached:
+                        return
+                if self.cbj:
+                    # the values were filtered without recording which constraint failed
+                    self.jumps[depth] |= self._neighbour_depths(slot)
+                depth = self._backtrack(depth)
+                continue
+
+            if not var.instance_next():
+                var.reset_instances()
+                values[slot] = None
+                depth = self._backtrack(depth)
+                continue
+            if limits is not None and not limits.node():
+                return
+            if cutoff is not None:
+                run_nodes += 1
+                if run_nodes > cutoff:
+                    # start again from the root, with the weights of dom_wdeg and the nogoods learned so far
+                    self._restart(depth)
+                    if self.relaxation is not None:
+                        self.relaxation.point = self.relaxed[0][1]
+                    cutoff = next(cutoffs)
+                    run_nodes = 0
+                    depth = 0
+                    self._enter(depth)
+                    continue
+
+            values[slot] = var.get_instanced()
+            if not self._check(slot, depth):
+                continue
+            if self.propagator is not None and not self.propagator.propagate(slot, values):
+                self.ordering.fail(self.propagator.conflict)
+                self.chronological[depth] = True
+                continue
+            if self.objective is not None and not self.objective.can_improve():
+                # branch and bound, nothing below can be as good as the best solution found
+                self.chronological[depth] = True
+                continue
+            if self.relaxation is not None and depth < last and not self._relax(depth):
+                self.chronological[depth] = True
+                continue
+
+            if depth == last:
+                self._found(depth)
+                cutoff = None
+                if limits is not None and limits.take(1) == 0:
+                    return
+                yield 1 if self.counting else tuple(values)
+                if limits is not None and limits.reached:
+                    return
+                continue
+            depth += 1
+            self._enter(depth)
+
+    def _enter(self, depth: int) -> None:
+        """Chooses the variable of a new depth, and schedules the constraints its values have to be checked with."""
+        self.ordering.select(self.order, depth, self.values)
+        slot = self.order[depth]
+        self.position[slot] = depth
+        self.jumps[depth] = set()
+        self.chronological[depth] = False
+        due = self.due[depth] = list()
+        partial = self.partial[depth] = list()
+        for check in self.checks[slot]:
+            index = check[0]
+            self.stacked[index] += 1
+            if self.stacked[index] == self.arity[index]:
+                due.append(check)
+            elif self.use_bounds:
+                partial.append(check)
+
+    def _leave(self, depth: int) -> None:
+        """Takes the variable of the depth out of the decision stack."""
+        for check in self.checks[self.order[depth]]:
+            self.stacked[check[0]] -= 1
+
+    def _relax(self, depth: int) -> bool:
+        """Solves the linear relaxation after the decision of `depth`, -1 for the root.
+        False if it has no point, or if its bound shows the objective can't reach the best value found."""
+        bounds = self.relaxation.solve(self.values)
+        if depth >= 0:
+            slot = self.order[depth]
+            self.relaxation.observe(slot, self.values[slot], self.relaxed[depth])
+        self.relaxed[depth + 1] = (self.relaxation.minimum, self.relaxation.point)
+        return bounds is not None and self.objective.can_reach(bounds)
+
+    def _restart(self, depth: int) -> None:
+        """Takes every variable out of the decision stack, from `depth` up to the root."""
+        for i in range(depth, -1, -1):
+            self._leave(i)
+            slot = self.order[i]
+            self.containers[slot].reset_instances()
+            self.values[slot] = None
+
+    def _found(self, depth: int) -> None:
+        """A solution was found, the depths above it can't be jumped over anymore."""
+        if self.gbj:
+            for i in range(depth + 1):
+                self.chronological[i] = True
+
+    def _neighbour_depths(self, slot: int) -> Set[int]:
+        return {self.position[i] for i in self.neighbours[slot] if self.values[i] is not None}
+
+    def _backtrack(self, depth: int) -> int:
+        """Depth to continue from after running out of values at `depth`, -1 if the search is over.
+        With gbj it jumps to the deepest instanced neighbour, or to the deepest depth that explained the failures below.
+        With cbj only the depths whose values made a constraint fail explain a failure, and their values are learned as a nogood."""
+        self._leave(depth)
+        if not self.gbj or self.chronological[depth]:
+            if self.gbj and depth > 0:
+                self.chronological[depth - 1] = True
+            return depth - 1
+        jump = self.jumps[depth]
+        if not self.cbj or self.propagator is not None:
+            # values removed by forward checking are explained by the neighbours that removed them
+            jump = jump | self._neighbour_depths(self.order[depth])
+        if self.nogoods is not None and len(jump) > 0:
+            self.nogoods.add(tuple(sorted((self.order[i], self.values[self.order[i]]) for i in jump)))
+        target = max(jump, default=-1)
+        for i in range(depth - 1, target, -1):
+            self._leave(i)
+            slot = self.order[i]
+            self.containers[slot].reset_instances()
+            self.values[slot] = None
+        if target >= 0:
+            self.jumps[target] |= jump - {target}
+        return target
+
+    def _check(self, slot: int, depth: int) -> bool:
+        """Evaluates the constraints that the value of the slot completes, and with bounds enabled, the interval bounds of the rest."""
+        values = self.values
+        if self.nogoods is not None:
+            nogood = self.nogoods.find(slot, values[slot], values)
+            if nogood is not None:
+                self.jumps[depth].update(self.position[i] for i, value in nogood if i != slot)
+                return False
+        for index, check, constr in self.due[depth]:
+            if not check(values):
+                self.ordering.fail(index)
+                if self.cbj:
+                    self._conflict(index, slot, depth)
+                return False
+        for index, check, constr in self.partial[depth]:
+            if constr.entailment() is False:
+                self.ordering.fail(index)
+                if self.propagator is not None:
+                    # the domains depend on the propagation of other variables
+                    self.chronological[depth] = True
+                elif self.cbj:
+                    self._conflict(index, slot, depth)
+                return False
+        return True
+
+    def _conflict(self, index: int, slot: int, depth: int) -> None:
+        """The constraint `index` failed with the value of the slot, because of the values of its other instanced slots."""
+        self.jumps[depth].update(self.position[i] for i in self.constr_slots[index] if i != slot and self.values[i] is not None)
+
+    def _batch_solutions(self, slot: int, var: IntVarContainer) -> Iterator[Any]:
+        """Tries every value of the last variable, filtering its whole domain with NumPy at once.
+        When counting, yields the amount of supported values at once."""
+        values = self.values
+        # every state of the domain is a subset of the one at the start of the search, so the size tells if it was pruned
+        if len(var.domain) != self.batch_sizes[slot]:
+            values[slot] = var.domain.as_array()
+        else:
+            if self.batch_domains[slot] is None:
+                self.batch_domains[slot] = var.domain.as_array()
+            values[slot] = self.batch_domains[slot]
+        supported = numpy.ones(len(var.domain), dtype=bool)
+        for index, check, constr in self.due[self.position[slot]]:
+            # every other variable is instanced
+            result = batch_call(check, values)
+            if result is None:
+                # let the Python evaluation raise the error
+                supported = None
+                break
+            supported &= result
+
+        if self.counting and supported is not None:
+            values[slot] = None
+            amount = int(numpy.count_nonzero(supported))
+            if amount > 0:
+                yield amount
+            return
+        candidates = list(enumerate(var.domain))
+        if var.value_order is not None:
+            rank = {value: k for k, value in enumerate(var.value_order(var.domain))}
+            candidates.sort(key=lambda candidate: rank[candidate[1]])
+        for i, value in candidates:
+            values[slot] = value
+            if supported is None:
+                if not self._check(slot, self.position[slot]):
+                    continue
+            elif not supported[i]:
+                continue
+            yield 1 if self.counting else tuple(values)
+        values[slot] = None
+
+
+def restart_cutoffs(schedule: str, base: int, factor: float) -> Iterator[int]:
+    """Nodes allowed to each run of a restart schedule. luby: `base` times 1, 1, 2, 1, 1, 2, 4, 1, ... geometric: `base` times powers of `factor`."""
+    run = 1
+    cutoff = float(base)
+    while True:
+        if schedule == "luby":
+            yield base * luby(run)
+        else:
+            yield int(cutoff)
+            cutoff *= factor
+        run += 1
+
+def luby(i: int) -> int:
+    """i-th term of the Luby sequence, from 1."""
+    while True:
+        k = i.bit_length()
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+
+def can_batch(constrs: List[VarsComparison], domains: List[Domain]) -> bool:
+    """True if NumPy is available and evaluates the constraints over these domains exactly, using float64."""
+    if numpy is None:
+        return False
+    magnitude = 0
+    for domain in domains:
+        if not isinstance(domain, IntDomain) and not all(isinstance(i, int) for i in domain):
+            return False
+        magnitude = max(magnitude, abs(domain.min()), abs(domain.max()))
+    for constr in constrs:
+        if not constr.get_magnitude(magnitude) < EXACT_FLOAT_LIMIT:
+            return False
+    return True
+
+def batch_call(function: Callable, values: List[Any]) -> Optional[Any]:
+    """Calls a compiled function with arrays as slots. Returns None if some value divides by zero."""
+    try:
+        with numpy.errstate(divide="raise", invalid="raise"):
+            return function(values)
+    except FloatingPointError:
+        return None
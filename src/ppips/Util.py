@@ -2,9 +2,57 @@
 
 from __future__ import annotations
 
+from functools import lru_cache
+from typing import Any, Callable, Sequence, Union
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+Number = Union[int, float]
+
+# Integers up to this magnitude are exactly representable as float64.
+EXACT_FLOAT_LIMIT = 2**53
+
 def are_equals(a, b) -> bool:
     if isinstance(a, (int, float, bool, str)):
         if isinstance(b, (int, float, bool, str)):
             return a == b
         return False
     return a.is_equal(b)
+
+def element_key(element) -> Any:
+    """Hashable key of an element of an expression: numbers by type and value, expressions by structure."""
+    if isinstance(element, float):
+        return (float, element.hex())
+    if isinstance(element, int):
+        return (type(element), element)
+    return element.get_key()
+
+def number_code(value: Number) -> str:
+    """Python source for a number literal, safe to embed in any generated expression."""
+    if value != value or value in (float("inf"), -float("inf")):
+        return f"float({str(value)!r})"
+    if value < 0:
+        return f"({value!r})"
+    return repr(value)
+
+@lru_cache(maxsize=1024)
+def compile_function(code: str) -> Callable:
+    """Builds (and caches) a function of the slot array `values` returning the result of `code`."""
+    return eval(compile(f"lambda values: {code}", "<ppips>", "eval"), {})
+
+def require_numpy() -> None:
+    if numpy is None:
+        raise RuntimeError("NumPy is needed for batch evaluation.")
+
+def evaluate_batch(function: Callable, values, columns: int):
+    """Calls a compiled function with each column of the 2-D array `values` as a slot."""
+    require_numpy()
+    values = numpy.asarray(values)
+    if values.ndim != 2 or values.shape[1] != columns:
+        raise ValueError(f"Expected a 2-D array with {columns} columns.")
+    with numpy.errstate(divide="raise"):
+        result = function([values[:, i] for i in range(columns)])
+    return numpy.broadcast_to(result, (values.shape[0],))
@@ -2,21 +2,373 @@
 
 from __future__ import annotations
 
-from typing import List, Dict, Set, Union, Optional, Collection
+from array import array
+from bisect import bisect_left, bisect_right
+from math import ceil, floor
+from typing import List, Dict, Set, Tuple, Union, Optional, Callable, Collection, Iterator, Any
 
 from .VarsOperations import AbstractVar
+from .Intervals import Interval
+from .Util import require_numpy, numpy
 
 # https://docs.python.org/3/reference/datamodel.html
 
 Number = Union[int, float]
 ElementDict = Dict[Union[AbstractVar, str], Number]
 
+# Sparse integer domains use one flag per value while their span is at most this times their size.
+DENSE_RATIO = 8
+INT64_LIMIT = 2**63
+
+
+class Domain:
+    """Ordered set of values of a variable."""
+    def __len__(self) -> int:
+        raise NotImplementedError()
+
+    def __contains__(self, value: Any) -> bool:
+        raise NotImplementedError()
+
+    def min(self) -> Number:
+        raise NotImplementedError()
+
+    def max(self) -> Number:
+        raise NotImplementedError()
+
+    def next_after(self, value: Number) -> Optional[Number]:
+        """Smallest value of the domain greater than `value`, or None."""
+        raise NotImplementedError()
+
+    def remove(self, value: Number, trail: Optional[Trail]=None) -> None:
+        """Removes a value, recording the change in `trail` if given."""
+        raise NotImplementedError()
+
+    def assign(self, value: Number, trail: Optional[Trail]=None) -> None:
+        """Narrows the domain to a single value, recording the change in `trail` if given."""
+        raise NotImplementedError()
+
+    def undo(self, state: Any) -> None:
+        """Reverts the change recorded with `state`."""
+        raise NotImplementedError()
+
+    def copy(self) -> Domain:
+        raise NotImplementedError()
+
+    def __iter__(self) -> Iterator[Number]:
+        # values can be removed while iterating
+        if len(self) == 0:
+            return
+        value: Optional[Number] = self.min()
+        while value is not None:
+            yield value
+            value = self.next_after(value)
+
+    def __repr__(self) -> str:
+        if len(self) > 10:
+            return f"{self.__class__.__name__}({self.min()!r}..{self.max()!r}, size={len(self)})"
+        return f"{self.__class__.__name__}({list(self)!r})"
+
+    def as_array(self):
+        """NumPy float64 array with the values in ascending order."""
+        require_numpy()
+        return numpy.fromiter(self, dtype=numpy.float64, count=len(self))
+
+    def retain(self, mask, trail: Optional[Trail]=None) -> int:
+        """Keeps the values whose flag is set in `mask`, a boolean array aligned with `as_array()`. Returns the amount of removed values."""
+        removed = [value for value, keep in zip(list(self), mask) if not keep]
+        for value in removed:
+            self.remove(value, trail)
+        return len(removed)
+
+    def restrict(self, lo: Number, hi: Number, trail: Optional[Trail]=None) -> int:
+        """Keeps the values within [lo, hi]. Returns the amount of removed values."""
+        removed = [value for value in self if value < lo or value > hi]
+        for value in removed:
+            self.remove(value, trail)
+        return len(removed)
+
+
+class IntDomain(Domain):
+    """Integer values within the window [lo, hi]. Once a value inside the window is removed, a flag per value tells which ones are left."""
+    def __init__(self, lo: int, hi: int, flags: Optional[bytearray]=None, base: Optional[int]=None) -> None:
+        self.lo = lo
+        self.hi = hi
+        # flags[i] tells if base+i is in the domain, or None if the whole window is
+        self.flags = flags
+        self.base = lo if base is None else base
+        if flags is None:
+            self.size = max(hi - lo + 1, 0)
+        else:
+            self.size = flags.count(1, lo - self.base, hi - self.base + 1)
+
+    @classmethod
+    def from_values(cls, values: List[int]) -> IntDomain:
+        """Domain of sorted unique integers."""
+        lo, hi = values[0], values[-1]
+        if hi - lo + 1 == len(values):
+            return cls(lo, hi)
+        flags = bytearray(hi - lo + 1)
+        for i in values:
+            flags[i - lo] = 1
+        return cls(lo, hi, flags)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, value: Any) -> bool:
+        if isinstance(value, float):
+            if not value.is_integer():
+                return False
+            value = int(value)
+        elif not isinstance(value, int):
+            return False
+        if value < self.lo or value > self.hi or self.size == 0:
+            return False
+        return self.flags is None or self.flags[value - self.base] == 1
+
+    def min(self) -> int:
+        if self.size == 0:
+            raise ValueError("Empty domain.")
+        return self.lo
+
+    def max(self) -> int:
+        if self.size == 0:
+            raise ValueError("Empty domain.")
+        return self.hi
+
+    def next_after(self, value: Number) -> Optional[int]:
+        candidate = max(floor(value) + 1, self.lo)
+        if candidate > self.hi or self.size == 0:
+            return None
+        if self.flags is None:
+            return candidate
+        pos = self.flags.find(1, candidate - self.base, self.hi - self.base + 1)
+        return None if pos == -1 else pos + self.base
+
+    def remove(self, value: Number, trail: Optional[Trail]=None) -> None:
+        if value not in self:
+            raise KeyError(value)
+        value = int(value)
+        if trail is not None:
+            trail.record(self, (self.lo, self.hi, self.size, self.flags, self.base, value))
+        self.size -= 1
+        if self.size == 0:
+            self.lo, self.hi = value + 1, value
+            return
+        if self.flags is None:
+            if value == self.lo:
+                self.lo += 1
+                return
+            if value == self.hi:
+                self.hi -= 1
+                return
+            self.flags = bytearray(b"\x01") * (self.hi - self.lo + 1)
+            self.base = self.lo
+        self.flags[value - self.base] = 0
+        if value == self.lo:
+            self.lo = self.flags.find(1, value - self.base + 1) + self.base
+        elif value == self.hi:
+            self.hi = self.flags.rfind(1, 0, value - self.base) + self.base
+
+    def assign(self, value: Number, trail: Optional[Trail]=None) -> None:
+        if value not in self:
+            raise KeyError(value)
+        if trail is not None:
+            trail.record(self, (self.lo, self.hi, self.size, self.flags, self.base, None))
+        # the flag of the value is already set
+        self.lo = self.hi = int(value)
+        self.size = 1
+
+    def undo(self, state: Tuple[int, int, int, Optional[bytearray], int, Optional[int]]) -> None:
+        self.lo, self.hi, self.size, self.flags, self.base, value = state
+        if value is not None and self.flags is not None:
+            self.flags[value - self.base] = 1
+
+    def copy(self) -> IntDomain:
+        flags = None if self.flags is None else bytearray(self.flags)
+        return IntDomain(self.lo, self.hi, flags, self.base)
+
+    def as_array(self):
+        require_numpy()
+        values = numpy.arange(self.lo, self.hi + 1, dtype=numpy.float64)
+        if self.flags is None or self.size == 0:
+            return values[:self.size]
+        start = self.lo - self.base
+        mask = numpy.frombuffer(self.flags, dtype=numpy.uint8)[start:start + len(values)]
+        return values[mask.astype(bool)]
+
+    def retain(self, mask, trail: Optional[Trail]=None) -> int:
+        require_numpy()
+        if self.size == 0:
+            return 0
+        if trail is not None:
+            # flags are replaced rather than modified, so the old ones are kept as they are
+            trail.record(self, (self.lo, self.hi, self.size, self.flags, self.base, None))
+        window = numpy.zeros(self.hi - self.lo + 1, dtype=numpy.uint8)
+        if self.flags is None:
+            window[:] = mask
+        else:
+            start = self.lo - self.base
+            window[numpy.frombuffer(self.flags, dtype=numpy.uint8)[start:start + len(window)] == 1] = mask
+        kept = int(numpy.count_nonzero(window))
+        removed = self.size - kept
+        self.flags = bytearray(window.tobytes())
+        self.base = self.lo
+        self.size = kept
+        if kept == 0:
+            self.lo, self.hi = self.hi + 1, self.hi
+        else:
+            self.lo, self.hi = self.flags.find(1) + self.base, self.flags.rfind(1) + self.base
+        return removed
+
+    def restrict(self, lo: Number, hi: Number, trail: Optional[Trail]=None) -> int:
+        lo, hi = max(ceil(lo), self.lo), min(floor(hi), self.hi)
+        if self.size == 0 or (lo == self.lo and hi == self.hi):
+            return 0
+        if trail is not None:
+            # only the window changes, the flags are kept as they are
+            trail.record(self, (self.lo, self.hi, self.size, self.flags, self.base, None))
+        size = self.size
+        if lo > hi:
+            self.lo, self.hi, self.size = self.hi + 1, self.hi, 0
+            return size
+        if self.flags is not None:
+            lo = self.flags.find(1, lo - self.base, hi - self.base + 1) + self.base
+            if lo < self.base:
+                self.lo, self.hi, self.size = self.hi + 1, self.hi, 0
+                return size
+            hi = self.flags.rfind(1, lo - self.base, hi - self.base + 1) + self.base
+            self.size = self.flags.count(1, lo - self.base, hi - self.base + 1)
+        else:
+            self.size = hi - lo + 1
+        self.lo, self.hi = lo, hi
+        return size - self.size
+
+
+class SortedDomain(Domain):
+    """Values kept in a sorted sequence, for floats and sparse integers."""
+    def __init__(self, values: List[Number]) -> None:
+        self.values: Union[array, List[Number]]
+        if all(type(i) is int and -INT64_LIMIT <= i < INT64_LIMIT for i in values):
+            self.values = array("q", values)
+        else:
+            self.values = list(values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _index(self, value: Any) -> int:
+        if not isinstance(value, (int, float)) or value != value:
+            return -1
+        i = bisect_left(self.values, value)
+        if i < len(self.values) and self.values[i] == value:
+            return i
+        return -1
+
+    def __contains__(self, value: Any) -> bool:
+        return self._index(value) != -1
+
+    def min(self) -> Number:
+        if len(self.values) == 0:
+            raise ValueError("Empty domain.")
+        return self.values[0]
+
+    def max(self) -> Number:
+        if len(self.values) == 0:
+            raise ValueError("Empty domain.")
+        return self.values[-1]
+
+    def next_after(self, value: Number) -> Optional[Number]:
+        i = bisect_right(self.values, value)
+        return self.values[i] if i < len(self.values) else None
+
+    def remove(self, value: Number, trail: Optional[Trail]=None) -> None:
+        i = self._index(value)
+        if i == -1:
+            raise KeyError(value)
+        if trail is not None:
+            trail.record(self, (self.values, i, self.values[i]))
+        del self.values[i]
+
+    def assign(self, value: Number, trail: Optional[Trail]=None) -> None:
+        i = self._index(value)
+        if i == -1:
+            raise KeyError(value)
+        if trail is not None:
+            trail.record(self, (self.values, None, None))
+        self.values = self.values[i:i+1]
+
+    def undo(self, state: Tuple[Any, Optional[int], Optional[Number]]) -> None:
+        values, i, value = state
+        self.values = values
+        if i is not None:
+            self.values.insert(i, value)
+
+    def copy(self) -> SortedDomain:
+        domain = SortedDomain([])
+        domain.values = self.values[:]
+        return domain
+
+    def restrict(self, lo: Number, hi: Number, trail: Optional[Trail]=None) -> int:
+        start, stop = bisect_left(self.values, lo), bisect_right(self.values, hi)
+        removed = len(self.values) - max(stop - start, 0)
+        if removed == 0:
+            return 0
+        if trail is not None:
+            trail.record(self, (self.values, None, None))
+        self.values = self.values[start:max(stop, start)]
+        return removed
+
+
+class Trail:
+    """Undo log of domain changes, grouped in levels that are reverted as a whole when the search backtracks."""
+    def __init__(self) -> None:
+        self.entries: List[Tuple[Domain, Any]] = list()
+        self.levels: List[int] = list()
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def record(self, domain: Domain, state: Any) -> None:
+        self.entries.append((domain, state))
+
+    def push_level(self) -> None:
+        self.levels.append(len(self.entries))
+
+    def pop_level(self) -> None:
+        """Reverts every change since the last level was pushed, in O(changes)."""
+        start = self.levels.pop()
+        entries = self.entries
+        while len(entries) > start:
+            domain, state = entries.pop()
+            domain.undo(state)
+
+    def clear(self) -> None:
+        while len(self.levels) > 0:
+            self.pop_level()
+        # changes recorded before the first level aren't reverted
+        self.entries.clear()
+
+
+def make_domain(values: Collection[Number]) -> Domain:
+    """Picks the representation for a collection of values: a window for ranges and dense integers, a sorted sequence otherwise."""
+    if isinstance(values, Domain):
+        return values.copy()
+    if isinstance(values, range) and values.step == 1:
+        return IntDomain(values.start, values.stop - 1)
+    unique = sorted(set(values))
+    if len(unique) > 0 and all(type(i) is int for i in unique):
+        if unique[-1] - unique[0] + 1 <= DENSE_RATIO * len(unique):
+            return IntDomain.from_values(unique)
+    return SortedDomain(unique)
+
+
 class IntVar(AbstractVar):
     def __init__(self, name: str, domain: Collection[Number]) -> None:
         super().__init__(name)
         if len(domain) == 0:
             raise RuntimeError("Domain can't be empty")
-        self.domain: Set[Number] = set(domain)
+        self.domain: Domain = make_domain(domain)
         self.value_instanced: Optional[Number] = None
 
     def __repr__(self) -> str:
@@ -26,11 +378,16 @@ class IntVar(AbstractVar):
             expr += f"\n\t\\Instanced: {self.value_instanced}/"
         return expr
 
-    def get_domain(self) -> Set[Number]:
+    def get_domain(self) -> Domain:
         return self.domain
+
+    def get_domain_bounds(self) -> Interval:
+        if self.value_instanced is not None:
+            return (self.value_instanced, self.value_instanced)
+        return (self.domain.min(), self.domain.max())
     
-    def remove_from_domain(self, value: Number) -> None:
-        self.domain.remove(value)
+    def remove_from_domain(self, value: Number, trail: Optional[Trail]=None) -> None:
+        self.domain.remove(value, trail)
     
     def instance_value(self, value: Number) -> None:
         self.validate(value)
@@ -60,32 +417,68 @@ class IntVar(AbstractVar):
             raise ValueError(f"Value must be part of {self.name}'s domain.")
 
 class IntVarContainer:
-    def __init__(self, var: IntVar) -> None:
+    def __init__(self, var: IntVar, trail: Optional[Trail]=None) -> None:
         self.var = var
-        self.domain = list(var.domain)
+        self.domain = var.domain
         self.pos = 0
+        self.last: Optional[Number] = None
+        self.done = False
+        # with a trail, each instanced value opens a level for the changes made while it lasts
+        self.trail = trail
+        self.level_open = False
+        # orders the values of the domain to try them, instead of ascending
+        self.value_order: Optional[Callable[[Domain], List[Number]]] = None
+        self.sequence: List[Number] = list()
     
     def instance_next(self) -> bool:
-        if self.pos >= len(self.domain):
+        self.close_level()
+        if self.done:
+            return False
+        if self.value_order is not None:
+            if self.pos == 0:
+                self.sequence = self.value_order(self.domain)
+            value = self.sequence[self.pos] if self.pos < len(self.sequence) else None
+        elif self.pos == 0:
+            value = self.domain.min() if len(self.domain) > 0 else None
+        else:
+            value = self.domain.next_after(self.last)
+        if value is None:
+            self.done = True
             return False
-        self.var.instance_value(self.domain[self.pos])
+        # the value comes from the domain, no need to validate it
+        self.var.value_instanced = value
+        self.last = value
         self.pos += 1
+        if self.trail is not None:
+            # the domain itself isn't narrowed, instanced variables are read from their value
+            self.trail.push_level()
+            self.level_open = True
         return True
+
+    def close_level(self) -> None:
+        """Reverts the changes made to the domains since the current value was instanced."""
+        if self.level_open:
+            self.trail.pop_level()
+            self.level_open = False
     
     def de_instance(self) -> None:
         self.var.de_instance()
         return
     
     def reset_instances(self) -> None:
+        self.close_level()
         self.de_instance()
         self.pos = 0
+        self.last = None
+        self.done = False
         return
     
     def get_var(self) -> IntVar:
         return self.var
     
     def get_instanced(self) -> Element:
-        inst = self.var()
+        # the value was validated when instanced
+        inst = self.var.value_instanced
         assert isinstance(inst, (int, float))
         return inst
 
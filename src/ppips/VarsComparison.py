@@ -2,9 +2,13 @@
 
 from __future__ import annotations
 
-from typing import Union
+from typing import Union, Callable, Sequence, Tuple, Optional
 
-from .Util import are_equals
+from .Util import are_equals, element_key, number_code, compile_function, evaluate_batch
+from . import Intervals
+from .Intervals import Interval
+
+Number = Union[int, float]
 
 class VarsComparison:
     def __init__(self, left, right, comp_type: str) -> None:
@@ -56,6 +60,45 @@ class VarsComparison:
     def __call__(self, vars_dict) -> Union[bool, VarsComparison]:
         return self.evaluate(vars_dict)
 
+    def get_code(self, slots) -> str:
+        """Python source that evaluates the comparison, reading each variable from `values[slots[var]]`."""
+        if self.comp_type not in ("<", "<=", "==", "!=", ">", ">="):
+            raise RuntimeError("Undefined comparison.")
+        if isinstance(self.left, (int, float)):
+            left = number_code(self.left)
+        else:
+            left = self.left.get_code(slots)
+        if isinstance(self.right, (int, float)):
+            right = number_code(self.right)
+        else:
+            right = self.right.get_code(slots)
+        return f"({left} {self.comp_type} {right})"
+
+    def compile(self, slots) -> Callable[[Sequence[Number]], bool]:
+        """Compiles the comparison into a flat function of the slot array."""
+        return compile_function(self.get_code(slots))
+
+    def evaluate_batch(self, values, vars: Sequence):
+        """Boolean mask with the result of the comparison for each row of `values`, a 2-D array with one column per variable of `vars`."""
+        return evaluate_batch(self.compile({var: i for i, var in enumerate(vars)}), values, len(vars))
+
+    def get_magnitude(self, var_magnitude: Number) -> Number:
+        """Upper bound for the absolute value of every intermediate result, if no variable exceeds `var_magnitude`."""
+        left = abs(self.left) if isinstance(self.left, (int, float)) else self.left.get_magnitude(var_magnitude)
+        right = abs(self.right) if isinstance(self.right, (int, float)) else self.right.get_magnitude(var_magnitude)
+        return max(left, right)
+
+    def get_bounds(self, bounds=None) -> Tuple[Interval, Interval]:
+        """Intervals of both sides, taking each variable's bounds from `bounds` or its domain."""
+        left = Intervals.point(self.left) if isinstance(self.left, (int, float)) else self.left.get_bounds(bounds)
+        right = Intervals.point(self.right) if isinstance(self.right, (int, float)) else self.right.get_bounds(bounds)
+        return left, right
+
+    def entailment(self, bounds=None) -> Optional[bool]:
+        """True if the comparison holds for every value within the bounds, False if it never holds, None if unknown."""
+        left, right = self.get_bounds(bounds)
+        return Intervals.compare(left, right, self.comp_type)
+
     def __bool__(self) -> bool:
         return False
     
@@ -102,6 +145,18 @@ class VarsComparison:
                 return True
         return False
 
+    def get_key(self) -> tuple:
+        """Hashable key, shared by the comparisons that are the same one written in another way."""
+        left = element_key(self.left)
+        right = element_key(self.right)
+        if self.comp_type == ">":
+            return ("<", right, left)
+        if self.comp_type == ">=":
+            return ("<=", right, left)
+        if self.comp_type in ("==", "!="):
+            return (self.comp_type, frozenset((left, right)))
+        return (self.comp_type, left, right)
+
     def _distribute_mult(self) -> None:
         # distribute multipications
         if not isinstance(self.left, (int, float)):
@@ -111,15 +166,13 @@ class VarsComparison:
 
     def _move_expressions_numbers(self) -> None:
         # simple numbers to right and expressions to left
-        if not isinstance(self.left, (int, float)):
-            self.right -= self.left.pop_numbers()
+        difference = self.left - self.right
+        if isinstance(difference, (int, float)):
+            self.left = difference
+            self.right = 0
         else:
-            self.right -= self.left
-            self.left = 0
-        if not isinstance(self.right, (int, float)):
-            numbers = self.right.pop_numbers()
-            self.left -= self.right
-            self.right = numbers
+            self.left, numbers = difference.split_numbers()
+            self.right = -numbers
 
         if self.right < 0:
             self.left = -self.left
@@ -131,19 +184,19 @@ class VarsComparison:
             elif self.comp_type == ">":
                 self.comp_type = "<"
             elif self.comp_type == ">=":
-                self.comp_type = "<"
+                self.comp_type = "<="
 
     def _group_same_expressions(self) -> None:
         if not isinstance(self.left, (int, float)):
-            self.left.group_same_expressions()
+            self.left = self.left.group_same_expressions()
         if not isinstance(self.right, (int, float)):
-            self.right.group_same_expressions()
+            self.right = self.right.group_same_expressions()
 
     def _sort_expressions(self) -> None:
         if not isinstance(self.left, (int, float)):
-            self.left.sort()
+            self.left = self.left.sort()
         if not isinstance(self.right, (int, float)):
-            self.right.sort()
+            self.right = self.right.sort()
 
     def redistribute(self) -> None:
         self._distribute_mult()
@@ -2,29 +2,51 @@
 
 from __future__ import annotations
 
-from typing import overload, List, Tuple, Dict, Set, Union, Optional, Collection, Any
+from itertools import islice
+from typing import overload, List, Tuple, Dict, Set, Union, Optional, Collection, Any, Callable, Sequence, Iterable
+from weakref import WeakValueDictionary
 
 from .VarsComparison import VarsComparison
-from .Util import are_equals
+from .Util import are_equals, element_key, number_code, compile_function, evaluate_batch
+from . import Intervals
+from .Intervals import Interval
 
 # https://docs.python.org/3/reference/datamodel.html
 
 Number = Union[int, float]
 
+# Longer sums are emitted as sum() calls, so the generated code doesn't nest too deep to compile.
+MAX_CODE_CHAIN = 256
+
+
+class HashConsing(type):
+    """Interns the instances of its classes, so structurally identical expressions are the same object.
+    Interned expressions are shared, so they must never be modified after being created."""
+    interned: WeakValueDictionary = WeakValueDictionary()
+
+    def __call__(cls, *args, **kwargs):
+        expr = super().__call__(*args, **kwargs)
+        key = (cls, tuple(element_key(i) for i in expr.elements))
+        interned = HashConsing.interned.get(key)
+        if interned is not None:
+            return interned
+        HashConsing.interned[key] = expr
+        return expr
+
 
 class ArithmeticElement:
     def __add__(self, other: ArithElement) -> AddType:
         if other == 0:
             return self
         if isinstance(other, (ArithmeticElement, int, float)):
-            return VarAdds(first=self, second=other)
+            return LinearExpr({self: 1}) + other
         return NotImplemented
     
     def __radd__(self, other: Element) -> AddType:
         if other == 0:
             return self
         if isinstance(other, (int, float)):
-            return VarAdds(first=other, second=self)
+            return LinearExpr({self: 1}, other)
         return NotImplemented
 
 
@@ -32,14 +54,14 @@ class ArithmeticElement:
         if other == 0:
             return self
         if isinstance(other, (ArithmeticElement, int, float)):
-            return VarAdds(first=self, second=-other)
+            return LinearExpr({self: 1}) - other
         return NotImplemented
 
     def __rsub__(self, other: Element) -> AddType:
         if other == 0:
             return -self
         if isinstance(other, (int, float)):
-            return VarAdds(first=other, second=-self)
+            return LinearExpr({self: -1}, other)
         return NotImplemented
 
 
@@ -48,8 +70,10 @@ class ArithmeticElement:
             return 0
         if other == 1:
             return self
-        if isinstance(other, (ArithmeticElement, int, float)):
-            return VarMult(first=self, second=other)
+        if isinstance(other, (int, float)):
+            return LinearExpr({self: other})
+        if isinstance(other, ArithmeticElement):
+            return multiply(self, other)
         return NotImplemented
 
     def __rmul__(self, other: Element) -> MultType:
@@ -58,7 +82,7 @@ class ArithmeticElement:
         if other == 1:
             return self
         if isinstance(other, (int, float)):
-            return VarMult(first=other, second=self)
+            return LinearExpr({self: other})
         return NotImplemented
 
 
@@ -114,7 +138,7 @@ class ArithmeticElement:
 
 
     def __neg__(self) -> ArithmeticElement:
-        return VarMult(first=-1, second=self)
+        return LinearExpr({self: -1})
 
 
     def __lt__(self, other):
@@ -151,6 +175,31 @@ class ArithmeticElement:
     def __call__(self, value) -> ArithElement:
         raise NotImplementedError()
 
+    def get_code(self, slots: SlotsDict) -> str:
+        """Python source that evaluates the expression, reading each variable from `values[slots[var]]`."""
+        raise NotImplementedError()
+
+    def compile(self, slots: SlotsDict) -> Callable[[Sequence[Number]], Number]:
+        """Compiles the expression into a flat function of the slot array."""
+        return compile_function(self.get_code(slots))
+
+    def evaluate_batch(self, values, vars: Sequence[AbstractVar]):
+        """Evaluates the expression for each row of `values`, a 2-D array with one column per variable of `vars`."""
+        return evaluate_batch(self.compile({var: i for i, var in enumerate(vars)}), values, len(vars))
+
+    def get_magnitude(self, var_magnitude: Number) -> Number:
+        """Upper bound for the absolute value of every intermediate result, if no variable exceeds `var_magnitude`."""
+        raise NotImplementedError()
+
+    def get_bounds(self, bounds: Optional[BoundsDict]=None) -> Interval:
+        """Interval containing every value of the expression, taking each variable's bounds from `bounds` or its domain."""
+        raise NotImplementedError()
+
+    def get_key(self) -> Any:
+        """Hashable key, equal for structurally identical expressions."""
+        # variables are compared by identity, and interned expressions are unique
+        return self
+
 
 class AbstractVar(ArithmeticElement):
     def __init__(self, name: str) -> None:
@@ -169,25 +218,6 @@ class AbstractVar(ArithmeticElement):
         return hash(self.name)
 
 
-    def __add__(self, other: ArithElement) -> AddType:
-        if other == 0:
-            return self
-        if isinstance(other, VarAdds):
-            return VarAdds(var_list=[self]+other.elements)
-        return super().__add__(other)
-
-
-    def __sub__(self, other: ArithElement) -> AddType:
-        if other == 0:
-            return self
-        if isinstance(other, VarAdds):
-            other = -other
-            if isinstance(other, VarAdds):
-                return VarAdds(var_list=[self]+other.elements)
-            return VarAdds(first=self, second=other)
-        return super().__sub__(other)
-
-
     def __call__(self, value: Union[Number, ElementDict] = None) -> Element:
         if value is None:
             return self
@@ -204,6 +234,22 @@ class AbstractVar(ArithmeticElement):
     def validate(self, value: Number) -> None:
         raise NotImplementedError()
 
+    def get_code(self, slots: SlotsDict) -> str:
+        if self not in slots:
+            raise ValueError(f"Variable {self.name} has no slot.")
+        return f"values[{slots[self]}]"
+
+    def get_magnitude(self, var_magnitude: Number) -> Number:
+        return var_magnitude
+
+    def get_bounds(self, bounds: Optional[BoundsDict]=None) -> Interval:
+        if bounds is not None and self in bounds:
+            return bounds[self]
+        return self.get_domain_bounds()
+
+    def get_domain_bounds(self) -> Interval:
+        raise NotImplementedError()
+
     def __bool__(self) -> bool:
         return True
 
@@ -218,31 +264,43 @@ class AbstractVar(ArithmeticElement):
     def distrubute_mul(self) -> AbstractVar:
         return self
 
-    def pop_numbers(self) -> Number:
-        return 0
+    def split_numbers(self) -> Tuple[ArithElement, Number]:
+        return self, 0
 
-    def group_same_expressions(self) -> None:
-        return None
+    def group_same_expressions(self) -> ArithElement:
+        return self
+
+    def sort(self) -> AbstractVar:
+        return self
 
-    def sort(self) -> None:
-        return None
 
+class MultiVar(ArithmeticElement, metaclass=HashConsing):
+    # folds the bounds of the elements from left to right
+    interval_operation: Callable[[Interval, Interval], Interval]
 
-class MultiVar(ArithmeticElement):
     def __init__(self, simbol: str, /, var_list: list=None, first=None, second=None, parenthesis: bool=True) -> None:
         self.simbol = simbol
         self.parenthesis = parenthesis
         if first is not None and second is not None:
             if var_list is not None:
                 raise RuntimeError()
-            self.elements = [first, second]
+            self.elements: Tuple[ArithElement, ...] = (first, second)
         elif var_list is not None:
             if first is not None or second is not None:
                 raise RuntimeError()
             assert len(var_list) >= 2
-            self.elements = list(var_list)
+            self.elements = tuple(var_list)
         else:
             raise RuntimeError()
+        self.hash_value = hash((self.__class__.__name__, *(hash(i) for i in self.elements)))
+
+    def __hash__(self):
+        # structural, so it can be compared across expressions that weren't interned together
+        return self.hash_value
+
+    def __reduce__(self):
+        # rebuilt through the constructor, so unpickled expressions are interned and hashed again
+        return (_rebuild_multivar, (self.__class__, self.elements))
 
     def __repr__(self):
         return f"{self.__class__.__name__}(var_list={self.elements!r})"
@@ -268,6 +326,41 @@ class MultiVar(ArithmeticElement):
     def __call__(self, vars_dict: ElementDict) -> ArithElement:
         return self.evaluate(vars_dict)
 
+    def get_elements_code(self, slots: SlotsDict) -> List[str]:
+        result = []
+        for i in self.elements:
+            if isinstance(i, (int, float)):
+                result.append(number_code(i))
+            else:
+                result.append(i.get_code(slots))
+        return result
+
+    def get_code(self, slots: SlotsDict) -> str:
+        return "(" + self.simbol.join(self.get_elements_code(slots)) + ")"
+
+    def get_elements_magnitude(self, var_magnitude: Number) -> List[Number]:
+        result = []
+        for i in self.elements:
+            if isinstance(i, (int, float)):
+                result.append(abs(i))
+            else:
+                result.append(i.get_magnitude(var_magnitude))
+        return result
+
+    def get_magnitude(self, var_magnitude: Number) -> Number:
+        # Valid for / and %: their result is either bounded by their operands or not an integer.
+        return max(self.get_elements_magnitude(var_magnitude))
+
+    def get_bounds(self, bounds: Optional[BoundsDict]=None) -> Interval:
+        result = None
+        for i in self.elements:
+            if isinstance(i, (int, float)):
+                interval = Intervals.point(i)
+            else:
+                interval = i.get_bounds(bounds)
+            result = interval if result is None else self.interval_operation(result, interval)
+        return result
+
     def __iter__(self):
         for i in self.elements:
             if isinstance(i, (int, float)):
@@ -277,8 +370,11 @@ class MultiVar(ArithmeticElement):
                     yield j
         
     def is_equal(self, other):
-        if not isinstance(other, MultiVar):
+        if self is other:
+            return True
+        if not isinstance(other, MultiVar) or self.hash_value != other.hash_value:
             return False
+        # only reached on hash collisions, or with different variables sharing their name
         if self.simbol != other.simbol:
             return False
         if len(self.elements) != len(other.elements):
@@ -293,133 +389,268 @@ class MultiVar(ArithmeticElement):
     def distrubute_mul(self) -> MultiVar:
         return self
 
-    def pop_numbers(self) -> Number:
-        return 0
+    def split_numbers(self) -> Tuple[ArithElement, Number]:
+        """Returns the expression without its number terms, and the sum of them."""
+        return self, 0
 
-    def group_same_expressions(self) -> None:
-        return None
+    def group_same_expressions(self) -> ArithElement:
+        return self
 
-    def sort(self) -> None:
-        """Bubble sort based sorting."""
-        for i in range(len(self.elements)):
-            if not isinstance(self.elements[i], (int, float)):
-                self.elements[i].sort()
-
-            for j in range(i):
-                if isinstance(self.elements[i], (int, float)):
-                    expr_a = str(self.elements[i])
-                else:
-                    expr_a = self.elements[i].get_expr()
-                if isinstance(self.elements[j], (int, float)):
-                    expr_b = str(self.elements[j])
-                else:
-                    expr_b = self.elements[j].get_expr()
-
-                if expr_a < expr_b:
-                    aux = self.elements[i]
-                    self.elements[i] = self.elements[j]
-                    self.elements[j] = aux
+    def sort_elements(self) -> List[ArithElement]:
+        """Elements with their own elements sorted."""
+        result = []
+        for i in self.elements:
+            if isinstance(i, (int, float)):
+                result.append(i)
+            else:
+                result.append(i.sort())
+        return result
 
-        return None
+    def sort(self) -> ArithElement:
+        # the order of the elements matters for everything except + and *
+        return self.__class__(var_list=self.sort_elements())
+
+    def commutative_sort(self) -> ArithElement:
+        elements = self.sort_elements()
+        elements.sort(key=lambda x: str(x) if isinstance(x, (int, float)) else x.get_expr())
+        return self.__class__(var_list=elements)
+
+
+class LinearExpr(ArithmeticElement):
+    """Sum of terms plus a constant. Each term is a variable or a nonlinear expression, multiplied by a number.
+
+    The (term, coefficient) pairs are appended to a log, of which each expression only reads its first `size`
+    pairs. That way adding to the newest expression of a log doesn't copy it, and building a sum of n terms
+    takes linear time. The pairs are merged into the `terms` dict the first time they are needed."""
+    def __init__(self, terms: Optional[Dict[ArithmeticElement, Number]]=None, constant: Number=0) -> None:
+        self.log: List[Tuple[ArithmeticElement, Number]] = list(terms.items()) if terms is not None else list()
+        self.size = len(self.log)
+        self.constant = constant
+        self.terms: Optional[Dict[ArithmeticElement, Number]] = None
+        self.key: Optional[tuple] = None
+
+    def extend(self, pairs: Iterable[Tuple[ArithmeticElement, Number]], constant: Number) -> LinearExpr:
+        """New expression with the pairs added to the terms of this one."""
+        result = LinearExpr(constant=constant)
+        if self.size == len(self.log):
+            result.log = self.log
+        else:
+            result.log = self.log[:self.size]
+        result.log.extend(pairs)
+        result.size = len(result.log)
+        return result
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # only the pairs of this expression are pickled, the caches are rebuilt when needed
+        state = dict(self.__dict__)
+        state["log"] = self.log[:self.size]
+        state["terms"] = None
+        state["key"] = None
+        return state
+
+    def get_terms(self) -> Dict[ArithmeticElement, Number]:
+        if self.terms is None:
+            terms: Dict[ArithmeticElement, Number] = dict()
+            for term, coeff in islice(self.log, self.size):
+                terms[term] = terms.get(term, 0) + coeff
+            self.terms = {term: coeff for term, coeff in terms.items() if coeff != 0}
+        return self.terms
 
-class VarAdds(MultiVar):
-    def __init__(self, /, var_list:list=None, first=None, second=None) -> None:
-        super().__init__(" + ", var_list=var_list, first=first, second=second)
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.get_terms()!r}, {self.constant!r})"
 
-    def evaluate(self, vars_dict: ElementDict) -> ArithElement:
-        result: Number = 0
-        for var in self.elements:
-            if isinstance(var, (int, float)):
-                result += var
+    def __str__(self):
+        return f"<{self.__class__.__name__}: {self.get_expr(True)}>"
+
+    def get_expr(self, disable_last_parenthesis=False) -> str:
+        result = []
+        for term, coeff in self.get_terms().items():
+            if coeff == 1:
+                result.append(term.get_expr())
             else:
-                result += var(vars_dict)
-        return result
+                result.append(f"{coeff}*{term.get_expr()}")
+        if self.constant != 0 or len(result) == 0:
+            result.append(str(self.constant))
+        expression = " + ".join(result)
+        if len(result) > 1 and not disable_last_parenthesis:
+            return f"({expression})"
+        return expression
 
 
     def __add__(self, other: ArithElement) -> AddType:
-        if other == 0:
-            return self
-        if isinstance(other, VarAdds):
-            return VarAdds(var_list=self.elements+other.elements)
-        elif isinstance(other, (ArithmeticElement, int, float)):
-            return VarAdds(var_list=self.elements+[other])
-        return super().__add__(other)
+        if isinstance(other, (int, float)):
+            if other == 0:
+                return self
+            return self.extend((), self.constant + other)
+        if isinstance(other, LinearExpr):
+            return self.extend(other.get_terms().items(), self.constant + other.constant)
+        if isinstance(other, ArithmeticElement):
+            return self.extend(((other, 1),), self.constant)
+        return NotImplemented
 
     def __radd__(self, other: Element) -> AddType:
-        if other == 0:
-            return self
-        if isinstance(other, (AbstractVar, int, float)):
-            return VarAdds(var_list=[other]+self.elements)
+        if isinstance(other, (int, float)):
+            return self.__add__(other)
         return NotImplemented
 
 
     def __sub__(self, other: ArithElement) -> AddType:
+        if isinstance(other, (int, float)):
+            if other == 0:
+                return self
+            return self.extend((), self.constant - other)
+        if isinstance(other, LinearExpr):
+            return self.extend(((term, -coeff) for term, coeff in other.get_terms().items()), self.constant - other.constant)
+        if isinstance(other, ArithmeticElement):
+            return self.extend(((other, -1),), self.constant)
+        return NotImplemented
+
+    def __rsub__(self, other: Element) -> AddType:
+        if isinstance(other, (int, float)):
+            return self.scale(-1) + other
+        return NotImplemented
+
+
+    def scale(self, factor: Number) -> LinearExpr:
+        return LinearExpr({term: coeff*factor for term, coeff in self.get_terms().items()}, self.constant*factor)
+
+    def __mul__(self, other: ArithElement) -> MultType:
         if other == 0:
+            return 0
+        if other == 1:
             return self
-        if isinstance(other, (ArithmeticElement, int, float)):
-            return VarAdds(var_list=self.elements+[-other])
+        if isinstance(other, (int, float)):
+            return self.scale(other)
+        if isinstance(other, ArithmeticElement):
+            return multiply(self, other)
+        return NotImplemented
+
+    def __rmul__(self, other: Element) -> MultType:
+        if isinstance(other, (int, float)):
+            return self.__mul__(other)
         return NotImplemented
 
 
     def __neg__(self) -> ArithmeticElement:
-        if len(self.elements) == 0:
-            return 0
-        if len(self.elements) == 1:
-            return -self.elements[0]
-        aux_list = list()
-        for i in self.elements:
-            aux_list.append(-i)
-        return VarAdds(var_list=aux_list)
+        return self.scale(-1)
 
 
-    def distrubute_mul(self) -> MultiVar:
-        new_elements = list()
-        for i in self.elements:
-            if isinstance(i, VarMult):
-                expr = i.distrubute_mul()
-                if isinstance(expr, VarAdds):
-                    new_elements += expr.elements
-                else:
-                    new_elements.append(expr)
+    def evaluate(self, vars_dict: ElementDict) -> ArithElement:
+        result: ArithElement = self.constant
+        for term, coeff in self.get_terms().items():
+            result += coeff * term(vars_dict)
+        return result
+
+    def __call__(self, vars_dict: ElementDict) -> ArithElement:
+        return self.evaluate(vars_dict)
+
+    def get_code(self, slots: SlotsDict) -> str:
+        result = []
+        if self.constant != 0 or len(self.get_terms()) == 0:
+            result.append(number_code(self.constant))
+        for term, coeff in self.get_terms().items():
+            if coeff == 1 and isinstance(coeff, int):
+                result.append(term.get_code(slots))
             else:
-                new_elements.append(i)
-        return VarAdds(var_list=new_elements)
-
-    def pop_numbers(self) -> Number:
-        result: Number = 0
-        for i in range(len(self.elements)-1, -1, -1):
-            j = self.elements[i]
-            if isinstance(j, (int, float)):
-                result += j
-                del self.elements[i]
+                result.append(f"{number_code(coeff)} * {term.get_code(slots)}")
+        if len(result) > MAX_CODE_CHAIN:
+            return "sum((" + ", ".join(result) + ",))"
+        return "(" + " + ".join(result) + ")"
+
+    def get_magnitude(self, var_magnitude: Number) -> Number:
+        result = abs(self.constant)
+        for term, coeff in self.get_terms().items():
+            result += max(abs(coeff), 1) * term.get_magnitude(var_magnitude)
         return result
 
-    def group_same_expressions(self) -> None:
-        k = len(self.elements)
-        while k >= 0:
-            found = False
-            i = len(self.elements)-1
-            while i > -1 and not found:
-                a = self.elements[i]
-                j = 0
-                while j < i and not found:
-                    b = self.elements[j]
-                    if are_equals(a, -b):
-                        del self.elements[i]
-                        del self.elements[j]
-                        found = True
-                    if are_equals(a, b):
-                        del self.elements[i]
-                        self.elements[j] = 2*self.elements[j]
-                        found = True
-                    j += 1
-                i += -1
-            k -= 1
-        return None
+    def get_bounds(self, bounds: Optional[BoundsDict]=None) -> Interval:
+        lo = hi = self.constant
+        for term, coeff in self.get_terms().items():
+            term_lo, term_hi = term.get_bounds(bounds)
+            if coeff > 0:
+                lo += coeff*term_lo
+                hi += coeff*term_hi
+            elif coeff < 0:
+                lo += coeff*term_hi
+                hi += coeff*term_lo
+        if lo != lo or hi != hi:
+            # inf - inf
+            return Intervals.UNBOUNDED
+        return (lo, hi)
+
+    def __iter__(self):
+        for term in self.get_terms():
+            for j in term:
+                yield j
+        yield self.constant
+
+    def get_key(self) -> tuple:
+        if self.key is None:
+            terms = frozenset((element_key(term), element_key(coeff)) for term, coeff in self.get_terms().items())
+            self.key = (LinearExpr, terms, element_key(self.constant))
+        return self.key
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def is_equal(self, other) -> bool:
+        if not isinstance(other, LinearExpr):
+            return False
+        return self.get_key() == other.get_key()
+
+    def simplify(self) -> ArithElement:
+        """The number or the single term this sum is made of, if that is all it has."""
+        terms = self.get_terms()
+        if len(terms) == 0:
+            return self.constant
+        if len(terms) == 1 and self.constant == 0:
+            term, coeff = next(iter(terms.items()))
+            if coeff == 1:
+                return term
+        return self
+
+    def expand_product(self, other: ArithElement) -> LinearExpr:
+        """Product with other expression as a sum, multiplying every pair of terms."""
+        if isinstance(other, (int, float)):
+            return self.scale(other)
+        other = as_linear(other)
+        pairs = list()
+        if other.constant != 0:
+            for term, coeff in self.get_terms().items():
+                pairs.append((term, coeff*other.constant))
+        if self.constant != 0:
+            for term, coeff in other.get_terms().items():
+                pairs.append((term, coeff*self.constant))
+        for term_a, coeff_a in self.get_terms().items():
+            for term_b, coeff_b in other.get_terms().items():
+                pairs.append((VarMult(var_list=[*get_factors(term_a), *get_factors(term_b)]), coeff_a*coeff_b))
+        return LinearExpr(constant=self.constant*other.constant).extend(pairs, self.constant*other.constant)
+
+    def distrubute_mul(self) -> ArithElement:
+        result: ArithElement = LinearExpr(constant=self.constant)
+        for term, coeff in self.get_terms().items():
+            result = result + coeff * term.distrubute_mul()
+        return result
+
+    def split_numbers(self) -> Tuple[ArithElement, Number]:
+        return LinearExpr(self.get_terms()).simplify(), self.constant
+
+    def group_same_expressions(self) -> ArithElement:
+        # the terms are already grouped by the log merge
+        return self
+
+    def sort(self) -> ArithElement:
+        terms: Dict[ArithmeticElement, Number] = dict()
+        for term, coeff in self.get_terms().items():
+            # sorting can make different terms equal, like x*y and y*x
+            term = term.sort()
+            terms[term] = terms.get(term, 0) + coeff
+        return LinearExpr(dict(sorted(terms.items(), key=lambda x: x[0].get_expr())), self.constant)
 
 
 class VarMult(MultiVar):
+    interval_operation = staticmethod(Intervals.mul)
+
     def __init__(self, /, var_list:list=None, first=None, second=None) -> None:
         super().__init__("*", var_list=var_list, first=first, second=second, parenthesis=False)
 
@@ -432,67 +663,28 @@ class VarMult(MultiVar):
                 result *= var(vars_dict)
         return result
 
-
-    def __mul__(self, other: ArithElement) -> MultType:
-        if other == 0:
-            return 0
-        if other == 1:
-            return self
-        if isinstance(other, (AbstractVar, int, float)):
-            return VarMult(var_list=self.elements+[other])
-        elif isinstance(other, VarMult):
-            return VarMult(var_list=self.elements+other.elements)
-        return super().__mul__(other)
-
-    def __rmul__(self, other: Element) -> MultType:
-        if other == 0:
-            return 0
-        if other == 1:
-            return self
-        if isinstance(other, (AbstractVar, int, float)):
-            return VarMult(var_list=[other]+self.elements)
-        return NotImplemented
+    def get_magnitude(self, var_magnitude: Number) -> Number:
+        result: Number = 1
+        for i in self.get_elements_magnitude(var_magnitude):
+            result *= max(i, 1)
+        return result
 
 
-    def __neg__(self) -> ArithmeticElement:
-        if -1 in self.elements:
-            aux_list = list(self.elements)
-            aux_list.remove(-1)
-            assert len(aux_list) != 0
-            if len(aux_list) == 1:
-                return aux_list[0]
-            return VarMult(var_list=aux_list)
-        else:
-            return VarMult(var_list=[-1]+self.elements)
+    def sort(self) -> ArithElement:
+        return self.commutative_sort()
 
-    def distrubute_mul(self) -> MultiVar:
-        mult_elements = list()
-        sums_elements = list()
+    def distrubute_mul(self) -> ArithElement:
+        result: LinearExpr = LinearExpr(constant=1)
         for i in self.elements:
-            if isinstance(i, VarAdds):
-                sums_elements.append(i)
-            else:
-                mult_elements.append(i)
-        if len(sums_elements) == 0:
-            return self
-
-        new_elements = list()
-
-        i = sums_elements[0]
-        i = i.distrubute_mul()
-        del sums_elements[0]
-        
-        first_sum = list()
-        for j in i:
-            first_sum.append(VarMult(var_list=mult_elements+[j]))
-        if len(sums_elements) == 0:
-            return VarAdds(var_list=first_sum)
-        
-        # TODO: implement the mult of sums, ex: (x+y)*(a+b)
-        return VarMult(var_list=first_sum+sums_elements)
+            if not isinstance(i, (int, float)):
+                i = i.distrubute_mul()
+            result = result.expand_product(i)
+        return result.simplify()
 
 
 class VarDiv(MultiVar):
+    interval_operation = staticmethod(Intervals.div)
+
     def __init__(self, /, var_list:list=None, first=None, second=None) -> None:
         super().__init__("/", var_list=var_list, first=first, second=second)
 
@@ -517,13 +709,13 @@ class VarDiv(MultiVar):
         if other == 1:
             return self
         if isinstance(other, (AbstractVar, int, float)):
-            return VarDiv(var_list=self.elements+[other])
-        elif isinstance(other, VarDiv):
-            return VarDiv(var_list=self.elements+other.elements)
+            return VarDiv(var_list=[*self.elements, other])
         return super().__truediv__(other)
 
 
 class VarPow(MultiVar):
+    interval_operation = staticmethod(Intervals.power)
+
     def __init__(self, /, var_list:list=None, first=None, second=None) -> None:
         super().__init__("**", var_list=var_list, first=first, second=second)
 
@@ -541,8 +733,28 @@ class VarPow(MultiVar):
                 result = result ** var(vars_dict)
         return result
 
+    def get_code(self, slots: SlotsDict) -> str:
+        # ** is right associative in Python, but the elements are evaluated from left to right.
+        codes = self.get_elements_code(slots)
+        result = codes[0]
+        for code in codes[1:]:
+            result = f"({result} ** {code})"
+        return result
+
+    def get_magnitude(self, var_magnitude: Number) -> Number:
+        magnitudes = self.get_elements_magnitude(var_magnitude)
+        result = magnitudes[0]
+        for i in magnitudes[1:]:
+            try:
+                result = max(float(max(result, 1)) ** i, result, i)
+            except OverflowError:
+                return float("inf")
+        return result
+
 
 class VarMod(MultiVar):
+    interval_operation = staticmethod(Intervals.mod)
+
     def __init__(self, /, var_list: list=None, first=None, second=None) -> None:
         super().__init__("%", var_list=var_list, first=first, second=second)
 
@@ -561,12 +773,70 @@ class VarMod(MultiVar):
         return result
 
 
+def as_linear(element: ArithElement) -> LinearExpr:
+    if isinstance(element, LinearExpr):
+        return element
+    if isinstance(element, (int, float)):
+        return LinearExpr(constant=element)
+    return LinearExpr({element: 1})
+
+def get_factors(element: ArithmeticElement) -> Tuple[ArithElement, ...]:
+    if isinstance(element, VarMult):
+        return element.elements
+    return (element,)
+
+def split_coefficient(element: ArithmeticElement) -> Tuple[Number, ArithmeticElement]:
+    if isinstance(element, LinearExpr) and element.constant == 0:
+        terms = element.get_terms()
+        if len(terms) == 1:
+            term, coeff = next(iter(terms.items()))
+            return coeff, term
+    return 1, element
+
+def multiply(a: ArithmeticElement, b: ArithmeticElement) -> ArithElement:
+    """Product of two expressions, keeping their coefficients out of the nonlinear term."""
+    coeff_a, term_a = split_coefficient(a)
+    coeff_b, term_b = split_coefficient(b)
+    term = VarMult(var_list=[*get_factors(term_a), *get_factors(term_b)])
+    if coeff_a*coeff_b == 1:
+        return term
+    return LinearExpr({term: coeff_a*coeff_b})
+
+def _rebuild_multivar(cls: type, elements: Tuple[ArithElement, ...]) -> MultiVar:
+    return cls(var_list=list(elements))
+
+def get_element_vars(element: ArithElement) -> Set[AbstractVar]:
+    """Variables an element is made of."""
+    if isinstance(element, (int, float)):
+        return set()
+    if bool(element):
+        return {element}
+    return {i for i in element if not isinstance(i, (int, float)) and bool(i)}
+
+def get_linear_form(element: ArithElement) -> Optional[Tuple[Dict[AbstractVar, Number], Number]]:
+    """Coefficient of each variable and constant of an element, or None if it isn't linear."""
+    if isinstance(element, (int, float)):
+        return dict(), element
+    if isinstance(element, AbstractVar):
+        return {element: 1}, 0
+    if not isinstance(element, LinearExpr):
+        return None
+    coeffs: Dict[AbstractVar, Number] = dict()
+    for term, coeff in element.get_terms().items():
+        if not isinstance(term, AbstractVar):
+            return None
+        coeffs[term] = coeff
+    return coeffs, element.constant
+
+
 Element = Union[AbstractVar, Number]
 ArithElement = Union[ArithmeticElement, Number]
 
 ElementDict = Dict[Union[AbstractVar, str], Number]
+SlotsDict = Dict[AbstractVar, int]
+BoundsDict = Dict[AbstractVar, Interval]
 
-AddType = Union[ArithmeticElement, Number, VarAdds]
+AddType = Union[ArithmeticElement, Number, LinearExpr]
 MultType = Union[ArithmeticElement, Number, VarMult]
 DivType = Union[ArithmeticElement, Number, VarDiv]
 PowType = Union[ArithmeticElement, Number, VarPow]
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import subprocess
+import sys
+import textwrap
+import unittest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(TESTS), "src")
+sys.path.insert(0, SRC)
+
+from ppips import IntVar, IntProblem
+
+
+def pigeonhole(n: int) -> IntProblem:
+    """Only x == 0 has solutions: any other value leaves fewer values than variables that must differ,
+    so the subproblems given to the other workers run long unless they are stopped."""
+    x = IntVar("x", range(64))
+    ys = [IntVar(f"y{i}", range(n)) for i in range(n)]
+    problem = IntProblem("pigeonhole", [])
+    for i in range(n):
+        problem += ys[i] + x <= n - 1
+        for j in range(i):
+            problem += ys[i] != ys[j]
+    problem.vars = [x] + ys
+    return problem
+
+
+class TestSolveParallelFirst(unittest.TestCase):
+    def test_first_stops_workers(self):
+        problem = pigeonhole(9)
+        solutions = problem.solve("first", {"workers": 2})
+        self.assertEqual(len(solutions), 1)
+        self.assertEqual(problem.evaluate(solutions[0]), (True, None))
+        self.assertEqual(problem.status, "optimal")
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_first_exits_cleanly(self):
+        script = textwrap.dedent("""
+            from test_Parallel import pigeonhole
+            problem = pigeonhole(10)
+            solutions = problem.solve("first", {"workers": 2})
+            print(len(solutions), problem.evaluate(solutions[0])[0])
+        """)
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join((SRC, TESTS))}
+        process = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, timeout=60)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(process.stderr, "")
+        self.assertEqual(process.stdout.split(), ["1", "True"])
+
+
+if __name__ == "__main__":
+    unittest.main()